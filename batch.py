@@ -0,0 +1,207 @@
+# batch.py - headless batch encoding/decoding with a resumable JSONL manifest
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dot_codec import (
+    RAW_SUFFIX, CodecStats, DecodeCache, encrypt_compact, encrypt_raw, encrypt_stream, decrypt_image,
+    decrypt_image_iter, decode_image, image_layout, load_codebook, normalize_message, render_message, save_png,
+)
+
+
+def content_hash(data):
+    """Return the SHA-256 hex digest of text or bytes."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def job_key(op, item_id, path, digest, **options):
+    """
+    Resume key of one job: the op, the item id, the output (or input) path
+    and every option that changes the result, plus the content hash.
+    """
+    return content_hash(json.dumps([op, item_id, os.path.abspath(path), options, digest], sort_keys=True))
+
+
+def load_done_keys(manifest_path, op):
+    """Return the job keys that already succeeded for op in an existing manifest."""
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a run killed mid-write leaves a partial last line
+            if record.get("op") == op and record.get("status") == "ok" and "key" in record:
+                done.add(record["key"])
+    return done
+
+
+def iter_messages(source):
+    """Yield (item_id, text) from a directory of .txt files or a JSONL file of {"id", "text"} records."""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".txt"):
+                with open(os.path.join(source, name), encoding="utf-8") as f:
+                    yield os.path.splitext(name)[0], f.read()
+        return
+    with open(source, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                record = json.loads(line)
+                yield str(record.get("id", line_no)), record["text"]
+
+
+def iter_images(source):
+    """Yield (item_id, path) for every PNG or raw cell file in a directory."""
+    for name in sorted(os.listdir(source)):
+        if name.lower().endswith((".png", RAW_SUFFIX)):
+            yield os.path.splitext(name)[0], os.path.join(source, name)
+
+
+def encode_item(item_id, text, output_path, verify=False, compact=None, raw=False, codebook=None):
+    """
+    Worker: encode one message to output_path and report timing. With verify,
+    the rendered image is decoded in memory before it is written and the
+    round trip is checked against the expected text. compact, a block size,
+    selects the compact palette format; raw writes a raw cell file instead.
+    codebook is the version of an installed extended codebook to encode with.
+    """
+    start = time.perf_counter()
+    stats = CodecStats()
+    record = {"id": item_id, "output": output_path}
+    book = load_codebook(codebook) if codebook else None
+    expected = normalize_message(text) if book is None else book.normalize(text)
+    if raw:
+        record["chars"] = encrypt_raw(text, output_path, stats=stats, codebook=book)
+        if verify:
+            record["verified"] = decrypt_image(output_path, stats=stats) == expected
+    elif compact:
+        record["chars"] = encrypt_compact(text, output_path, block=compact, codebook=book)
+        if verify:
+            decoded = decrypt_image(output_path, stats=stats)
+            record["verified"] = decoded == expected
+    elif verify:
+        image = render_message(text, stats=stats, codebook=book)
+        decoded = decode_image(image, stats=stats)
+        record["verified"] = decoded == expected
+        with stats.stage("compress"):
+            save_png(image, output_path)
+        record["chars"] = image_layout(image)["chars"]
+    else:
+        record["chars"] = encrypt_stream(text, output_path, stats=stats, codebook=book)
+    record["seconds"] = round(time.perf_counter() - start, 6)
+    record["stats"] = stats.as_dict()
+    return record
+
+
+def decode_item(item_id, path, cache_dir=None):
+    """
+    Worker: decode one image and report timing. With cache_dir, results are
+    shared through an on-disk DecodeCache keyed by pixels, which needs the
+    whole image in memory instead of streaming it.
+    """
+    start = time.perf_counter()
+    stats = CodecStats()
+    if cache_dir is not None:
+        text = decrypt_image(path, stats=stats, cache=DecodeCache(directory=cache_dir))
+    else:
+        text = "".join(decrypt_image_iter(path, stats=stats))
+    return {"id": item_id, "source": path, "chars": len(text), "text": text,
+            "seconds": round(time.perf_counter() - start, 6), "stats": stats.as_dict()}
+
+
+def run(op, jobs, manifest_path, workers):
+    """
+    Run (item_id, sha256, key, fn, args) jobs across a process pool, skipping
+    keys already recorded as done and appending one manifest line per finished
+    item. Items with the same content are still run one by one, since each
+    has its own output.
+    """
+    done = load_done_keys(manifest_path, op)
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(manifest_path, "a", encoding="utf-8") as manifest:
+        futures = {}
+        for item_id, digest, key, fn, args in jobs:
+            if key in done:
+                counts["skipped"] += 1
+                continue
+            futures[pool.submit(fn, *args)] = (item_id, digest, key)
+
+        for future in as_completed(futures):
+            item_id, digest, key = futures[future]
+            try:
+                record = dict(future.result(), status="ok")
+            except Exception as e:
+                record = {"id": item_id, "status": "error", "error": str(e)}
+            record.update(op=op, sha256=digest, key=key)
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            counts[record["status"]] += 1
+    return counts
+
+
+def encode_jobs(source, output_dir, verify=False, compact=None, raw=False, codebook=None):
+    os.makedirs(output_dir, exist_ok=True)
+    suffix = RAW_SUFFIX if raw else ".png"
+    for item_id, text in iter_messages(source):
+        output_path = os.path.join(output_dir, f"{item_id}{suffix}")
+        digest = content_hash(text)
+        key = job_key("encode", item_id, output_path, digest, verify=verify, compact=compact, raw=raw,
+                      codebook=codebook)
+        yield item_id, digest, key, encode_item, (item_id, text, output_path, verify, compact, raw, codebook)
+
+
+def decode_jobs(source, cache_dir=None):
+    for item_id, path in iter_images(source):
+        with open(path, "rb") as f:
+            digest = content_hash(f.read())
+        yield item_id, digest, job_key("decode", item_id, path, digest), decode_item, (item_id, path, cache_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch encode messages or decode dot images.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--manifest", default="manifest.jsonl", help="JSONL results manifest, appended to and used for resuming")
+    commands = parser.add_subparsers(dest="op", required=True)
+
+    encode = commands.add_parser("encode", help="encode a directory of .txt files or a JSONL file of messages")
+    encode.add_argument("source")
+    encode.add_argument("output_dir")
+    encode.add_argument("--verify", action="store_true", help="decode each image in memory and check the round trip")
+    encode.add_argument("--compact", type=int, metavar="K", default=None,
+                        help="write the compact palette format with K x K pixels per dot")
+    encode.add_argument("--raw", action="store_true", help=f"write raw cell files ({RAW_SUFFIX}) instead of PNGs")
+    encode.add_argument("--codebook", type=int, metavar="VERSION", default=None,
+                        help="encode with an extended codebook compiled by codebook.py")
+
+    decode = commands.add_parser("decode", help="decode a directory of PNG images and raw cell files")
+    decode.add_argument("source")
+    decode.add_argument("--cache-dir", help="share decoded results between runs and folders through this directory")
+
+    args = parser.parse_args(argv)
+    if args.op == "encode":
+        jobs = encode_jobs(args.source, args.output_dir, args.verify, args.compact, args.raw, args.codebook)
+    else:
+        jobs = decode_jobs(args.source, args.cache_dir)
+
+    start = time.perf_counter()
+    counts = run(args.op, jobs, args.manifest, args.workers)
+    print(f"{args.op}: {counts['ok']} done, {counts['skipped']} skipped, "
+          f"{counts['error']} failed in {time.perf_counter() - start:.2f}s")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
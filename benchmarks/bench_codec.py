@@ -0,0 +1,214 @@
+"""
+Throughput benchmark for the dot codec.
+
+Generates synthetic messages over the DOT_PATTERNS alphabet and times
+encoding, PNG save, PNG load and decoding separately, on clean images and on
+noise-injected ones that force the fuzzy nearest-pattern path. Every case runs
+in a fresh subprocess so its peak RSS is its own.
+
+    python benchmarks/bench_codec.py                          # run and print
+    python benchmarks/bench_codec.py --save-baseline base.json
+    python benchmarks/bench_codec.py --baseline base.json --threshold 0.25
+
+With --baseline the exit status is 1 if any stage's chars/sec dropped by more
+than the threshold fraction.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import dot_codec  # noqa: E402
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+DEFAULT_NOISE = 40  # +/- per channel; enough to push most cells onto the fuzzy path
+DEFAULT_THRESHOLD = 0.25
+# Cases whose canvas exceeds this many pixels use the streaming encoder/decoder
+STREAM_PIXELS = 50_000_000
+# Cases smaller than this are repeated and the best time per stage kept
+REPEAT_BELOW = 10000
+REPEATS = 5
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_message(size, seed=0):
+    alphabet = list(dot_codec.DOT_PATTERNS)
+    rng = random.Random(seed)
+    return "".join(rng.choice(alphabet) for _ in range(size))
+
+
+def add_noise(arr, amplitude, rng):
+    """Return arr with uniform +/- amplitude noise added to every channel."""
+    import numpy as np
+    noise = rng.integers(-amplitude, amplitude + 1, arr.shape, dtype=np.int16)
+    return np.clip(arr.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def timed(stages, name, fn, *args):
+    """Call fn(*args), keeping the best time seen for this stage."""
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    stages[name] = min(stages.get(name, elapsed), elapsed)
+    return result
+
+
+def run_in_memory(message, noise):
+    import numpy as np
+    from PIL import Image
+
+    stages = {}
+    for _ in range(REPEATS if len(message) < REPEAT_BELOW else 1):
+        image = timed(stages, "encode", dot_codec.render_message, message)
+        if noise:
+            image = Image.fromarray(add_noise(np.asarray(image), noise, np.random.default_rng(0)))
+        buffer = io.BytesIO()
+        timed(stages, "save", image.save, buffer, "PNG")
+        del image
+        image = timed(stages, "load", lambda: Image.open(io.BytesIO(buffer.getvalue())).convert("RGB"))
+        decoded = timed(stages, "decode", dot_codec.decode_image, image)
+    return stages, decoded
+
+
+def write_noisy_stream(message, noise, path):
+    """Fixture for large noisy cases: render band by band, add noise and stream to PNG (untimed)."""
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    width, height = dot_codec.image_size(len(message))
+    indices = dot_codec.glyph_indices(message)
+    band = 64 * dot_codec.CHARS_PER_ROW
+    with open(path, "wb") as f:
+        writer = dot_codec.PNGStreamWriter(f, width, height)
+        y = 0
+        for start in range(0, len(indices), band):
+            rows = dot_codec.render_rows(indices[start:start + band], width=width)[:height - y]
+            writer.write_rows(add_noise(rows, noise, rng))
+            y += len(rows)
+        writer.close()
+
+
+def run_streaming(message, noise):
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.png")
+        if noise:
+            write_noisy_stream(message, noise, path)
+        else:
+            # The streaming encoder renders and compresses in one pass
+            timed(stages, "encode+save", dot_codec.encrypt_stream, message, path)
+        decoded = timed(stages, "load+decode", lambda: "".join(dot_codec.decrypt_image_iter(path)))
+    return stages, decoded
+
+
+def run_case(size, noise):
+    """Run one benchmark case in this process and return its result record."""
+    message = synthetic_message(size)
+    dot_codec.decode_image(dot_codec.render_message("warm up"))  # first-use imports and tables
+    width, height = dot_codec.image_size(size)
+    streaming = width * height > STREAM_PIXELS
+    stages, decoded = (run_streaming if streaming else run_in_memory)(message, noise)
+
+    record = {
+        "size": size,
+        "noise": noise,
+        "mode": "streaming" if streaming else "in-memory",
+        "seconds": {name: round(seconds, 6) for name, seconds in stages.items()},
+        "chars_per_sec": {name: round(size / seconds, 1) if seconds else None for name, seconds in stages.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if not noise:
+        record["roundtrip_ok"] = decoded.rstrip(" ") == dot_codec.normalize_message(message).rstrip(" ")
+    return record
+
+
+def case_key(record):
+    return f"{record['size']}/{'noisy' if record['noise'] else 'clean'}"
+
+
+def run_all(sizes, noise):
+    results = {}
+    for size in sizes:
+        for amplitude in (0, noise):
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-case", str(size), str(amplitude)],
+                capture_output=True, text=True,
+            )
+            if proc.returncode:
+                raise RuntimeError(f"case {size}/{amplitude} failed:\n{proc.stderr}")
+            record = json.loads(proc.stdout)
+            results[case_key(record)] = record
+            rates = ", ".join(f"{name} {rate:,.0f}" for name, rate in record["chars_per_sec"].items())
+            rss = record["peak_rss_mb"]
+            print(f"{case_key(record):>14} [{record['mode']}] chars/sec: {rates}"
+                  + (f"; peak RSS {rss:.0f} MB" if rss is not None else "")
+                  + ("" if record.get("roundtrip_ok", True) else "; ROUND TRIP FAILED"))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions of results against baseline."""
+    regressions = []
+    for key, record in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for stage, rate in record["chars_per_sec"].items():
+            base_rate = base["chars_per_sec"].get(stage)
+            if rate and base_rate and rate < base_rate * (1 - threshold):
+                regressions.append(f"{key} {stage}: {rate:,.0f} chars/sec vs baseline {base_rate:,.0f} "
+                                   f"({(1 - rate / base_rate) * 100:.1f}% slower)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dot codec encode/save/load/decode throughput.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--noise", type=int, default=DEFAULT_NOISE, help="noise amplitude for the noisy cases")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a stored JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed fractional slowdown before a stage counts as a regression")
+    parser.add_argument("--run-case", nargs=2, type=int, metavar=("SIZE", "NOISE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(*args.run_case)))
+        return 0
+
+    results = run_all(args.sizes, args.noise)
+    failed = any(not record.get("roundtrip_ok", True) for record in results.values())
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Cold-start budget for dot_codec.
+
+Imports the codec in fresh interpreters under `python -X importtime` and
+fails if the best cumulative import time exceeds the budget, or if importing
+it drags in Tk, Pillow or NumPy. Run from anywhere:
+
+    python benchmarks/check_importtime.py [--budget-ms 10] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Measured at about 2 ms on a warm bytecode cache; the budget leaves headroom for slow CI machines
+IMPORT_BUDGET_MS = 10.0
+FORBIDDEN_MODULES = ("numpy", "PIL", "tkinter", "customtkinter")
+
+
+def measure_import():
+    """Return (cumulative import time of dot_codec in ms, top-level modules it imported)."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure a warm bytecode cache, like deployed workers
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import dot_codec"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    cumulative_us = None
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # column header
+        modules.add(name.strip().split(".")[0])
+        if name.strip() == "dot_codec" and not name[1:].startswith(" "):
+            cumulative_us = int(cumulative)
+    if cumulative_us is None:
+        raise RuntimeError("dot_codec did not appear in the -X importtime output")
+    return cumulative_us / 1000, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the dot_codec cold-start import budget.")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    measure_import()  # populate __pycache__
+    timings = []
+    for _ in range(args.runs):
+        ms, modules = measure_import()
+        timings.append(ms)
+        heavy = sorted(set(FORBIDDEN_MODULES) & modules)
+        if heavy:
+            print(f"FAIL: importing dot_codec also imported {', '.join(heavy)}")
+            return 1
+
+    best = min(timings)
+    print(f"dot_codec import: best {best:.2f} ms, median {sorted(timings)[len(timings) // 2]:.2f} ms "
+          f"(budget {args.budget_ms:.2f} ms)")
+    if best > args.budget_ms:
+        print("FAIL: import time over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Regression check for background-padded images.
+
+Renders short messages (one to four glyph rows, including the two-row case
+grid detection mis-measures), pads them with background on the right and
+bottom, and fails unless every padded image decodes to the message, with
+and without its layout metadata, on both decode backends. Run from anywhere:
+
+    python benchmarks/check_padding.py [--max-padding 24] [--step 3]
+"""
+import argparse
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from dot_codec import BG_COLOR, CHARS_PER_ROW, decode_image, image_layout, np, render_message  # noqa: E402
+
+MESSAGE_LENGTHS = (1, 5, CHARS_PER_ROW, CHARS_PER_ROW + 1, 2 * CHARS_PER_ROW, 3 * CHARS_PER_ROW + 1)
+
+
+def padded(arr, right, bottom):
+    out = np.empty((arr.shape[0] + bottom, arr.shape[1] + right, 3), dtype=np.uint8)
+    out[:] = BG_COLOR
+    out[:arr.shape[0], :arr.shape[1]] = arr
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that background-padded dot images still decode.")
+    parser.add_argument("--max-padding", type=int, default=24, help="largest padding in pixels")
+    parser.add_argument("--step", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    checked = failures = 0
+    for length in MESSAGE_LENGTHS:
+        message = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(length))
+        image = render_message(message)
+        arr, layout = np.asarray(image), image_layout(image)
+        for right in range(0, args.max_padding + 1, args.step):
+            for bottom in range(0, args.max_padding + 1, args.step):
+                source = padded(arr, right, bottom)
+                for metadata in (None, layout):
+                    for backend in ("numpy", "python"):
+                        checked += 1
+                        try:
+                            text = decode_image(source, backend=backend, layout=metadata)
+                        except ValueError as e:
+                            text = f"<{e}>"
+                        # Without metadata, padding wide enough for another glyph decodes as spaces
+                        if (text if metadata else text.rstrip()) != message:
+                            failures += 1
+                            print(f"FAIL: {message!r} padded {right}x{bottom} px "
+                                  f"({backend}, {'with' if metadata else 'without'} layout): {text!r}")
+
+    print(f"padded images: {checked} decodes, {failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Load test for server.py.
+
+Starts the server on a free localhost port (or targets --port of one already
+running) and drives it with keep-alive clients at several concurrency levels,
+reporting p50/p99 latency and requests/sec of successful requests, plus the
+count of rejected (503), timed-out (504) or failed ones, per level.
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --op decode --size 5000 --concurrency 1 8 32
+    python benchmarks/loadtest.py --port 8765 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from server import HOST  # noqa: E402
+
+DEFAULT_CONCURRENCY = (1, 4, 16, 64)
+DEFAULT_REQUESTS = 200
+DEFAULT_SIZE = 200
+# Seconds the server started here gets to shut its worker pool down after SIGTERM
+SHUTDOWN_TIMEOUT = 10.0
+
+
+def synthetic_message(size, seed=0):
+    rng = random.Random(seed)
+    return "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ ") for _ in range(size))
+
+
+async def request(reader, writer, path, body):
+    """Send one keep-alive POST and return (status, body, connection closed by the server)."""
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {HOST}\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    chunks = []
+    while True:
+        size = int((await reader.readline()).strip(), 16)
+        chunks.append(await reader.readexactly(size + 2))
+        if size == 0:
+            break
+    closed = headers.get("connection", "").lower() == "close"
+    return status, b"".join(chunk[:-2] for chunk in chunks), closed
+
+
+async def client(port, jobs, latencies, statuses):
+    reader = writer = None
+    while jobs:
+        path, body = jobs.pop()
+        if writer is None:
+            reader, writer = await asyncio.open_connection(HOST, port)
+        start = time.perf_counter()
+        try:
+            status, _, closed = await request(reader, writer, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status, closed = "connection error", True
+        if closed:
+            # Rejections close the connection; reconnect for the next request
+            writer.close()
+            writer = None
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+    if writer is not None:
+        writer.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_level(port, concurrency, payloads, num_requests):
+    jobs = [payloads[i % len(payloads)] for i in range(num_requests)]
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, jobs, latencies, statuses) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "requests_per_sec": len(latencies) / elapsed,
+        "errors": {status: count for status, count in statuses.items() if status != 200},
+    }
+
+
+async def build_payloads(port, op, size):
+    text = synthetic_message(size).encode("utf-8")
+    if op == "encode":
+        return [("/encode", text)]
+    reader, writer = await asyncio.open_connection(HOST, port)
+    status, png, _ = await request(reader, writer, "/encode", text)
+    writer.close()
+    if status != 200:
+        raise RuntimeError(f"could not build the decode payload: HTTP {status}")
+    if op == "decode":
+        return [("/decode", png)]
+    return [("/encode", text), ("/decode", png)]
+
+
+def start_server(workers):
+    """Run server.py on a free port and return (process, port)."""
+    command = [sys.executable, os.path.join(REPO_ROOT, "server.py"), "--port", "0"]
+    if workers:
+        command += ["--workers", str(workers)]
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith("Serving on"):
+        proc.kill()
+        raise RuntimeError("server did not start")
+    return proc, int(line.rsplit(":", 1)[1])
+
+
+async def run(args, port):
+    payloads = await build_payloads(port, args.op, args.size)
+    # Warm every worker's imports and tables before timing
+    await run_level(port, 4, payloads, 8)
+    for concurrency in args.concurrency:
+        result = await run_level(port, concurrency, payloads, args.requests)
+        errors = ", ".join(f"{status}: {count}" for status, count in result["errors"].items())
+        print(f"concurrency {concurrency:>4}: p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+              f"{result['requests_per_sec']:8.1f} req/s" + (f"  errors {errors}" if errors else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the localhost dot codec server.")
+    parser.add_argument("--port", type=int, help="target a running server instead of starting one")
+    parser.add_argument("--workers", type=int, help="worker processes for the server started here")
+    parser.add_argument("--op", choices=("encode", "decode", "mixed"), default="mixed")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="characters per message")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY))
+    args = parser.parse_args(argv)
+
+    proc = None
+    port = args.port
+    if port is None:
+        proc, port = start_server(args.workers)
+    try:
+        asyncio.run(run(args, port))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=SHUTDOWN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
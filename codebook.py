@@ -0,0 +1,142 @@
+# codebook.py - compile dot codebooks for extended alphabets with maximal glyph separation
+import argparse
+import os
+import string
+import sys
+
+import numpy as np
+
+from dot_codec import (
+    CODEBOOK_VERSION, DOT_DISTANCE, DOTS_PER_CHAR, EMPTY, ESCAPE_CHAR, HEX_DIGITS, Codebook, codebook_path,
+    load_codebook,
+)
+
+# Named pieces an alphabet can be built from, e.g. "upper,digits,punct"
+ALPHABETS = {
+    "upper": string.ascii_uppercase,
+    "lower": string.ascii_lowercase,
+    "digits": string.digits,
+    "punct": string.punctuation,
+    "ascii": string.ascii_letters + string.digits + string.punctuation,
+}
+# Random candidate patterns the glyphs are picked from
+DEFAULT_POOL_SIZE = 60000
+# Rounds of moving the closest glyph further out after the greedy pick
+DEFAULT_ROUNDS = 2000
+
+
+def expand_alphabet(spec):
+    """
+    Turn "upper,digits" style specs into a character string; pieces that are
+    not ALPHABETS names are taken literally (a lone comma is written ",,").
+    """
+    chars = []
+    for piece in spec.replace(",,", "\0").split(","):
+        piece = piece.replace("\0", ",")
+        chars.extend(ALPHABETS.get(piece, piece))
+    return "".join(chars)
+
+
+def compile_codebook(alphabet, version, escapes=False, seed=0, pool_size=DEFAULT_POOL_SIZE,
+                     rounds=DEFAULT_ROUNDS):
+    """
+    Generate patterns for every character of alphabet (plus space, and with
+    escapes the escape glyph and the hex digits its sequences use) so that the
+    smallest match_pattern distance between two glyphs is as large as we can
+    find: glyphs are picked greedily as the candidate farthest from those
+    already chosen, then the member of the closest pair is repeatedly swapped
+    for the candidate farthest from the rest. Deterministic for a given seed.
+    """
+    if version == CODEBOOK_VERSION:
+        raise ValueError(f"Version {CODEBOOK_VERSION} is the built-in codebook")
+    chars = [" "]
+    for char in alphabet + (ESCAPE_CHAR + HEX_DIGITS if escapes else ""):
+        if char not in chars:
+            chars.append(char)
+    if len(chars) > pool_size:
+        raise ValueError(f"{len(chars)} glyphs need a candidate pool of more than {pool_size} patterns")
+
+    rng = np.random.default_rng(seed)
+    pool = np.unique(rng.integers(0, EMPTY + 1, size=(pool_size, DOTS_PER_CHAR)), axis=0)
+    pool = pool[(pool != EMPTY).any(axis=1)]  # the blank pattern is reserved for space
+    distance = np.array(DOT_DISTANCE, dtype=np.float64)
+
+    def distances_to(pattern):
+        return sum(distance[pool[:, p], pattern[p]] for p in range(DOTS_PER_CHAR))
+
+    chosen = [np.full(DOTS_PER_CHAR, EMPTY)]
+    picked = []  # pool index of each glyph after the space
+    nearest = distances_to(chosen[0])
+    for _ in range(len(chars) - 1):
+        k = int(nearest.argmax())
+        picked.append(k)
+        chosen.append(pool[k])
+        nearest = np.minimum(nearest, distances_to(pool[k]))
+
+    to_glyph = np.stack([distances_to(pattern) for pattern in chosen])  # (glyphs, pool)
+    for _ in range(rounds):
+        pairwise = to_glyph[:, picked]  # distance between glyph i and glyph j + 1
+        pairwise[np.arange(1, len(chosen)), np.arange(len(picked))] = np.inf
+        i, j = np.unravel_index(pairwise.argmin(), pairwise.shape)
+        worst = pairwise[i, j]
+        glyph = j + 1  # move the non-space member of the closest pair
+        others = np.delete(to_glyph, glyph, axis=0).min(axis=0)
+        others[picked] = -np.inf
+        k = int(others.argmax())
+        if others[k] <= worst:
+            break
+        picked[glyph - 1] = k
+        chosen[glyph] = pool[k]
+        to_glyph[glyph] = distances_to(pool[k])
+
+    return Codebook(version, chars, np.stack(chosen).astype(np.uint8))
+
+
+def describe(codebook, closest=5):
+    """A short report: glyph count, minimum distance and the closest pairs."""
+    n = len(codebook)
+    pairs = sorted(
+        (float(codebook.distance[i, j]), codebook.chars[i], codebook.chars[j])
+        for i in range(n) for j in range(i + 1, n)
+    )
+    lines = [f"codebook v{codebook.version}: {n} glyphs, minimum distance {codebook.min_distance:.1f}"
+             + (", escapes" if codebook.escape is not None else "")]
+    for dist, a, b in pairs[:closest]:
+        lines.append(f"  {a!r} ~ {b!r}: {dist:.1f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile or inspect dot codebooks.")
+    commands = parser.add_subparsers(dest="op", required=True)
+
+    compile_ = commands.add_parser("compile", help="compile a codebook for an alphabet and install it")
+    compile_.add_argument("version", type=int, help=f"codebook version, above {CODEBOOK_VERSION}")
+    compile_.add_argument("--alphabet", default="upper,digits,punct",
+                          help=f"comma-separated pieces: {', '.join(ALPHABETS)} or literal characters")
+    compile_.add_argument("--escapes", action="store_true",
+                          help="spell characters outside the alphabet as escape sequences instead of spaces")
+    compile_.add_argument("--seed", type=int, default=0)
+    compile_.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE)
+    compile_.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    compile_.add_argument("-o", "--output", help="codebook file (default: the path decoders load it from)")
+
+    show = commands.add_parser("show", help="report the separation of an installed codebook")
+    show.add_argument("version", type=int, nargs="?", default=CODEBOOK_VERSION)
+
+    args = parser.parse_args(argv)
+    if args.op == "compile":
+        codebook = compile_codebook(expand_alphabet(args.alphabet), args.version, args.escapes, args.seed,
+                                    args.pool_size, args.rounds)
+        output = args.output or codebook_path(args.version)
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        codebook.save(output)
+        print(describe(codebook))
+        print(f"written to {output}")
+    else:
+        print(describe(load_codebook(args.version)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
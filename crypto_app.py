@@ -1,185 +1,19 @@
 import customtkinter as ctk
-from PIL import Image, ImageDraw, ImageTk
-import os
-import io
-import base64
-import math
+from PIL import Image
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# ---- Constants ----
-# Colors (RGB)
-BLACK = (0, 0, 0)
-WHITE = (255, 255, 255)
-GRAY = (128, 128, 128)
-GREEN = (0, 255, 0)
-BLUE = (0, 0, 255)
-RED = (255, 0, 0)
-COLORS = [BLACK, WHITE, GRAY, GREEN, BLUE, RED]
+from dot_codec import (
+    PLAN_ASPECT, Cancelled, CodecStats, DecodeCache, IncrementalEncoder, compact_block_size, decode_image,
+    render_message, save_png,
+)
+from preview import TiledPreview
 
-# Dot grid settings
-DOT_SIZE = 10
-GRID_WIDTH = 3
-GRID_HEIGHT = 3
-GRID_SPACING = 5
-CHAR_SPACING = 20
-ROW_SPACING = 10
-
-# Background color
-BG_COLOR = (200, 200, 200)
-
-# Define patterns for letters
-DOT_PATTERNS = {
-    'T': [WHITE, GRAY, WHITE, None, BLACK, WHITE, BLACK, BLACK, None],
-    'H': [WHITE, GRAY, WHITE, BLACK, BLACK, WHITE, BLACK, None, None],
-    'I': [None, BLACK, None, WHITE, BLACK, None, WHITE, BLUE, WHITE],
-    'S': [None, BLUE, None, WHITE, WHITE, WHITE, None, BLACK, BLACK],
-    'M': [WHITE, WHITE, WHITE, BLACK, WHITE, BLACK, BLUE, WHITE, None],
-    'E': [WHITE, GREEN, None, None, BLACK, None, WHITE, WHITE, WHITE],
-    'W': [WHITE, WHITE, None, WHITE, BLACK, BLACK, WHITE, BLACK, None],
-    'U': [BLACK, WHITE, WHITE, GREEN, WHITE, WHITE, WHITE, GRAY, WHITE],
-    'O': [BLACK, BLACK, BLACK, None, WHITE, WHITE, None, GRAY, None],
-    'C': [None, BLACK, None, GREEN, GRAY, None, BLACK, BLACK, BLACK],
-    'F': [WHITE, WHITE, WHITE, WHITE, BLUE, BLACK, None, None, BLACK],
-    'R': [WHITE, BLUE, WHITE, WHITE, WHITE, BLACK, BLACK, None, BLACK],
-    'A': [WHITE, WHITE, None, None, GRAY, WHITE, None, WHITE, WHITE],
-    'L': [WHITE, WHITE, WHITE, None, RED, WHITE, None, BLACK, BLACK],
-    'P': [WHITE, WHITE, WHITE, BLACK, None, WHITE, BLACK, BLACK, BLACK],
-    'B': [None, BLACK, None, BLACK, BLUE, BLACK, BLACK, WHITE, None],
-    'N': [WHITE, GRAY, WHITE, BLACK, WHITE, None, None, BLACK, BLACK],
-    'D': [GRAY, WHITE, BLACK, None, RED, BLACK, BLUE, None, None],
-    'G': [GRAY, BLACK, WHITE, None, GREEN, RED, BLUE, None, None],
-    'J': [BLACK, GRAY, WHITE, None, RED, BLUE, GREEN, None, None],
-    'K': [WHITE, GRAY, BLACK, None, BLUE, RED, GREEN, None, None],
-    'Q': [GRAY, WHITE, BLACK, None, GREEN, RED, BLUE, None, None],
-    'V': [BLACK, GRAY, WHITE, None, BLUE, GREEN, RED, None, None],
-    'X': [WHITE, BLACK, GRAY, None, RED, BLUE, GREEN, None, None],
-    'Y': [GRAY, BLACK, WHITE, None, BLUE, RED, GREEN, None, None],
-    'Z': [WHITE, GRAY, BLACK, None, RED, GREEN, BLUE, None, None],
-    ' ': [None, None, None, None, None, None, None, None, None]
-}
-
-# Build reverse lookup: pattern-tuple → character
-PATTERN_TO_CHAR = {tuple(v): k for k, v in DOT_PATTERNS.items()}
-
-# ---- Helper Functions ----
-def color_distance(color1, color2):
-    """Calculate Euclidean distance between two RGB colors"""
-    if color1 is None or color2 is None:
-        return 0 if color1 == color2 else 999
-    r1, g1, b1 = color1
-    r2, g2, b2 = color2
-    return math.sqrt((r1 - r2) ** 2 + (g1 - g2) ** 2 + (b1 - b2) ** 2)
-
-def find_closest_color(pixel, bg_color):
-    """Find the closest matching color from the predefined colors or None for bg"""
-    if pixel is None:
-        return None
-        
-    # If it's close to the background color, consider it None
-    if color_distance(pixel, bg_color) < 30:  # Threshold for background
-        return None
-        
-    # Find the closest color from our defined palette
-    closest = None
-    min_dist = float('inf')
-    for color in COLORS:
-        dist = color_distance(pixel, color)
-        if dist < min_dist:
-            min_dist = dist
-            closest = color
-    return closest
-
-def match_pattern(extracted_pattern, patterns_dict):
-    """Find the best match for an extracted pattern from the patterns dictionary"""
-    best_match = None
-    best_score = float('inf')
-    
-    for pattern, char in patterns_dict.items():
-        score = 0
-        for i, (p1, p2) in enumerate(zip(extracted_pattern, pattern)):
-            score += color_distance(p1, p2)
-        
-        if score < best_score:
-            best_score = score
-            best_match = char
-            
-    return best_match
-
-# ---- Functions ----
-def draw_dot_grid(draw, x, y, pattern):
-    """Draw a 3x3 grid of colored dots at position (x, y), skipping None values."""
-    for row in range(GRID_HEIGHT):
-        for col in range(GRID_WIDTH):
-            color = pattern[row * GRID_WIDTH + col]
-            if color is None:
-                continue  # Skip drawing if color is None (mimics unused dots)
-            dot_x = x + col * (DOT_SIZE + GRID_SPACING)
-            dot_y = y + row * (DOT_SIZE + GRID_SPACING)
-            # Draw a circle (dot) at the calculated position
-            draw.ellipse(
-                [dot_x, dot_y, dot_x + DOT_SIZE, dot_y + DOT_SIZE],
-                fill=color
-            )
-
-def extract_dot_grid(img, x, y):
-    """
-    Sample the center of each DOT_SIZE×DOT_SIZE cell.
-    If it equals BG_COLOR, treat it as None; otherwise record the RGB tuple.
-    """
-    pat = []
-    for ry in range(GRID_HEIGHT):
-        for rx in range(GRID_WIDTH):
-            dot_x = x + rx * (DOT_SIZE + GRID_SPACING)
-            dot_y = y + ry * (DOT_SIZE + GRID_SPACING)
-            cx = dot_x + DOT_SIZE // 2
-            cy = dot_y + DOT_SIZE // 2
-            
-            # Ensure coordinates are within image bounds
-            if cx >= img.width or cy >= img.height:
-                pat.append(None)
-                continue
-                
-            pixel = img.getpixel((cx, cy))
-            closest_color = find_closest_color(pixel, BG_COLOR)
-            pat.append(closest_color)
-    return tuple(pat)
-
-def decrypt_image(path="encrypted_message.png"):
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"No such file: {path}")
-
-    img = Image.open(path).convert("RGB")
-    W, H = img.size
-
-    grid_w = GRID_WIDTH * (DOT_SIZE + GRID_SPACING) - GRID_SPACING
-    grid_h = GRID_HEIGHT * (DOT_SIZE + GRID_SPACING) - GRID_SPACING
-
-    # how many chars fit per row/column
-    cols = (W + CHAR_SPACING) // (grid_w + CHAR_SPACING)
-    rows = (H + ROW_SPACING) // (grid_h + ROW_SPACING)
-
-    result = []
-    for ry in range(rows):
-        for cx in range(cols):
-            x = cx * (grid_w + CHAR_SPACING)
-            y = ry * (grid_h + ROW_SPACING)
-            if x + grid_w > W or y + grid_h > H:
-                continue
-                
-            extracted_pattern = extract_dot_grid(img, x, y)
-            
-            # First try direct match (for speed)
-            char = PATTERN_TO_CHAR.get(extracted_pattern)
-            
-            # If no direct match, use pattern matching
-            if char is None:
-                # Create dictionary of all patterns with characters as values
-                pattern_dict = {pattern: char for char, pattern in DOT_PATTERNS.items()}
-                char = match_pattern(extracted_pattern, pattern_dict)
-            
-            result.append(char if char is not None else '?')
-
-    # join and lowercase
-    return "".join(result).lower()
+# Interval for polling background jobs (~60 fps)
+JOB_POLL_MS = 16
+# Typing pause before the live preview catches up
+LIVE_PREVIEW_MS = 150
 
 class CryptoApp(ctk.CTk):
     def __init__(self):
@@ -211,6 +45,18 @@ class CryptoApp(ctk.CTk):
         # Initialize variables
         self.current_image = None
         
+        # Live preview: only the glyph cells changed since the last keystroke are redrawn
+        self.live_encoder = IncrementalEncoder()
+        self.live_shown = False
+        self.live_after = None
+        
+        # Background work: one job at a time, results marshalled back via after()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Decrypting the same pixels again (or a reloaded file) skips the decode
+        self.decode_cache = DecodeCache()
+        self.job_events = queue.Queue()
+        self.job = None
+        
     def create_header(self):
         header_frame = ctk.CTkFrame(self)
         header_frame.grid(row=0, column=0, padx=20, pady=(20, 0), sticky="ew")
@@ -255,6 +101,7 @@ class CryptoApp(ctk.CTk):
             font=ctk.CTkFont(size=14)
         )
         self.message_entry.grid(row=1, column=0, padx=20, pady=(0, 20), sticky="nsew")
+        self.message_entry.bind("<KeyRelease>", self.schedule_live_preview)
         
         # Action buttons
         encrypt_button = ctk.CTkButton(
@@ -296,14 +143,9 @@ class CryptoApp(ctk.CTk):
         display_panel.grid_rowconfigure(0, weight=1)  # Image
         display_panel.grid_rowconfigure(1, weight=0)  # Decrypted text
         
-        # Image display
-        self.image_frame = ctk.CTkFrame(display_panel)
-        self.image_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
-        self.image_frame.grid_columnconfigure(0, weight=1)
-        self.image_frame.grid_rowconfigure(0, weight=1)
-        
-        self.image_label = ctk.CTkLabel(self.image_frame, text="No image generated yet")
-        self.image_label.grid(row=0, column=0, padx=0, pady=0, sticky="nsew")
+        # Image display: renders only the visible tiles, scroll to pan, Ctrl+wheel to zoom
+        self.preview = TiledPreview(display_panel, empty_text="No image generated yet")
+        self.preview.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
         
         # Decrypted text display
         decrypted_frame = ctk.CTkFrame(display_panel)
@@ -327,6 +169,7 @@ class CryptoApp(ctk.CTk):
     def create_footer(self):
         footer_frame = ctk.CTkFrame(self)
         footer_frame.grid(row=2, column=0, padx=20, pady=(0, 20), sticky="ew")
+        footer_frame.grid_columnconfigure(0, weight=1)
         
         status_label = ctk.CTkLabel(
             footer_frame, 
@@ -335,136 +178,226 @@ class CryptoApp(ctk.CTk):
         )
         status_label.grid(row=0, column=0, padx=20, pady=10, sticky="w")
         
+        self.progress_bar = ctk.CTkProgressBar(footer_frame, width=200)
+        self.progress_bar.set(0)
+        self.progress_bar.grid(row=0, column=1, padx=10, pady=10)
+        
+        self.cancel_button = ctk.CTkButton(
+            footer_frame, 
+            text="Cancel", 
+            width=80,
+            font=ctk.CTkFont(size=12),
+            state="disabled",
+            command=self.cancel_job
+        )
+        self.cancel_button.grid(row=0, column=2, padx=(0, 20), pady=10)
+        
         self.status_label = status_label
         
+    # ---- Background jobs ----
+    def start_job(self, description, work, on_done):
+        """
+        Run work(progress) on the worker thread and call on_done(result) on the
+        Tk thread. progress(done, total) updates the footer bar and raises
+        Cancelled once the user has pressed Cancel.
+        """
+        if self.job is not None:
+            self.update_status("Busy, please wait or cancel the current job")
+            return
+        
+        cancel = threading.Event()
+        events = self.job_events
+        
+        def progress(done, total):
+            if cancel.is_set():
+                raise Cancelled()
+            events.put((done, total))
+        
+        future = self.executor.submit(work, progress)
+        self.job = (future, cancel, on_done)
+        self.progress_bar.set(0)
+        self.cancel_button.configure(state="normal")
+        self.update_status(description)
+        self.after(JOB_POLL_MS, self.poll_job)
+    
+    def poll_job(self):
+        future, cancel, on_done = self.job
+        
+        # Only the latest progress report matters
+        latest = None
+        while True:
+            try:
+                latest = self.job_events.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None and latest[1]:
+            self.progress_bar.set(latest[0] / latest[1])
+        
+        if not future.done():
+            self.after(JOB_POLL_MS, self.poll_job)
+            return
+        
+        self.job = None
+        self.cancel_button.configure(state="disabled")
+        try:
+            result = future.result()
+        except Cancelled:
+            self.progress_bar.set(0)
+            self.update_status("Cancelled")
+            return
+        except Exception as e:
+            self.progress_bar.set(0)
+            self.update_status(f"Error: {str(e)}")
+            return
+        self.progress_bar.set(1)
+        on_done(result)
+    
+    def cancel_job(self):
+        if self.job is not None:
+            self.job[1].set()
+            self.update_status("Cancelling...")
+    
+    def destroy(self):
+        # Abort any in-flight job so closing the window does not wait for it
+        if self.job is not None:
+            self.job[1].set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
+    
     def encrypt_message(self):
         message = self.message_entry.get("1.0", "end-1c")
         if not message:
             self.update_status("Please enter a message to encrypt")
             return
-            
-        # Calculate image dimensions
-        chars_per_row = 8
+        
         num_chars = len(message)
-        num_rows = (num_chars + chars_per_row - 1) // chars_per_row
-        grid_pixel_width = GRID_WIDTH * (DOT_SIZE + GRID_SPACING) - GRID_SPACING
-        grid_pixel_height = GRID_HEIGHT * (DOT_SIZE + GRID_SPACING) - GRID_SPACING
-        image_width = chars_per_row * (grid_pixel_width + CHAR_SPACING) - CHAR_SPACING
-        image_height = num_rows * (grid_pixel_height + ROW_SPACING) - ROW_SPACING
-
-        # Create image
-        image = Image.new("RGB", (image_width, image_height), color=BG_COLOR)
-        draw = ImageDraw.Draw(image)
-
-        # Draw message
-        for i, char in enumerate(message.upper()):
-            if char not in DOT_PATTERNS:
-                continue
-            row = i // chars_per_row
-            col = i % chars_per_row
-            x = col * (grid_pixel_width + CHAR_SPACING)
-            y = row * (grid_pixel_height + ROW_SPACING)
-            draw_dot_grid(draw, x, y, DOT_PATTERNS[char])
-
-        # Save temporary and display
-        image.save("encrypted_message.png")
-        self.current_image = image
-        self.display_image(image)
-        self.update_status(f"Message encrypted: {num_chars} characters")
+        stats = CodecStats()
+        # Plan the layout to the preview's shape instead of a fixed 8 characters per row
+        width, height = self.preview.winfo_width(), self.preview.winfo_height()
+        aspect = width / height if width > 1 and height > 1 else PLAN_ASPECT
+        
+        def work(progress):
+            # Render message from cached glyph tiles
+            return render_message(message, None, progress=progress, stats=stats, aspect=aspect)
         
-        # Clear decrypted text
-        self.decrypted_text.delete("1.0", "end")
+        def done(image):
+            self.display_image(image)
+            self.update_status(f"Message encrypted: {num_chars} characters ({stats.summary()})")
+            
+            # Clear decrypted text
+            self.decrypted_text.delete("1.0", "end")
+        
+        self.start_job("Encrypting...", work, done)
     
     def decrypt_current_image(self):
-        if self.current_image is None:
+        image = self.shown_image()
+        if image is None:
             self.update_status("No image to decrypt. Please encrypt a message or load an image first.")
             return
         
-        try:
-            # Save the current image if it's not already saved
-            if not os.path.exists("encrypted_message.png"):
-                self.current_image.save("encrypted_message.png")
-                
-            # Decrypt the image
-            decrypted_text = decrypt_image("encrypted_message.png")
-            
+        stats = CodecStats()
+        cache = self.decode_cache
+        
+        def work(progress):
+            # Decode the image in memory, exactly as shown
+            return decode_image(image, progress=progress, stats=stats, cache=cache)
+        
+        def done(decrypted_text):
             # Display the decrypted text
             self.decrypted_text.delete("1.0", "end")
             self.decrypted_text.insert("1.0", decrypted_text)
-            self.update_status("Image decrypted successfully")
-        except Exception as e:
-            self.update_status(f"Error decrypting image: {str(e)}")
+            self.update_status(f"Image decrypted successfully ({stats.summary()})")
+        
+        self.start_job("Decrypting...", work, done)
     
     def load_image(self):
-        try:
-            import tkinter.filedialog as filedialog
-            file_path = filedialog.askopenfilename(
-                title="Select Encrypted Image",
-                filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
-            )
-            
-            if not file_path:
-                return
-                
-            image = Image.open(file_path).convert("RGB")
-            self.current_image = image
+        import tkinter.filedialog as filedialog
+        file_path = filedialog.askopenfilename(
+            title="Select Encrypted Image",
+            filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
+        )
+        
+        if not file_path:
+            return
+        
+        def work(progress):
+            with Image.open(file_path) as image:
+                # Loading picks up layout metadata stored after the pixels; compact images stay in palette mode
+                image.load()
+                # Copies keep the metadata and let the file be closed here
+                return image.copy() if compact_block_size(image) else image.convert("RGB")
+        
+        def done(image):
             self.display_image(image)
             self.update_status(f"Image loaded from {file_path}")
             
             # Clear decrypted text
             self.decrypted_text.delete("1.0", "end")
-        except Exception as e:
-            self.update_status(f"Error loading image: {str(e)}")
+        
+        self.start_job(f"Loading {file_path}...", work, done)
     
     def save_image(self):
-        if self.current_image is None:
+        image = self.shown_image()
+        if image is None:
             self.update_status("No image to save. Please encrypt a message first.")
             return
-            
-        try:
-            import tkinter.filedialog as filedialog
-            file_path = filedialog.asksaveasfilename(
-                title="Save Encrypted Image",
-                defaultextension=".png",
-                filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
-            )
-            
-            if not file_path:
-                return
-                
-            self.current_image.save(file_path)
+        
+        import tkinter.filedialog as filedialog
+        file_path = filedialog.asksaveasfilename(
+            title="Save Encrypted Image",
+            defaultextension=".png",
+            filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
+        )
+        
+        if not file_path:
+            return
+        
+        def work(progress):
+            save_png(image, file_path)
+        
+        def done(result):
             self.update_status(f"Image saved to {file_path}")
-        except Exception as e:
-            self.update_status(f"Error saving image: {str(e)}")
+        
+        self.start_job(f"Saving to {file_path}...", work, done)
     
     def display_image(self, image):
-        # Calculate the available space in the image frame
-        self.image_frame.update()
-        max_width = self.image_frame.winfo_width() - 40
-        max_height = self.image_frame.winfo_height() - 40
-        
-        if max_width <= 0 or max_height <= 0:
-            # Widget not fully initialized yet, use default values
-            max_width = 700
-            max_height = 500
-        
-        # Resize the image to fit the available space while preserving aspect ratio
-        width, height = image.size
-        ratio = min(max_width/width, max_height/height)
-        new_width = int(width * ratio)
-        new_height = int(height * ratio)
-        
-        # Resize and convert to CTkImage
-        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        ctk_image = ctk.CTkImage(
-            light_image=resized_image,
-            dark_image=resized_image,
-            size=(new_width, new_height)
-        )
+        self.current_image = image
+        self.live_shown = False
+        self.preview.set_image(image)
+    
+    def shown_image(self):
+        """The image in the preview: the last encrypted or loaded one, or a snapshot of the live preview."""
+        if self.live_shown:
+            return self.live_encoder.image()
+        return self.current_image
+    
+    # ---- Live preview ----
+    def schedule_live_preview(self, event=None):
+        # Debounce: restart the timer on every keystroke
+        if self.live_after is not None:
+            self.after_cancel(self.live_after)
+        self.live_after = self.after(LIVE_PREVIEW_MS, self.update_live_preview)
+    
+    def update_live_preview(self):
+        self.live_after = None
+        message = self.message_entry.get("1.0", "end-1c")
+        box = self.live_encoder.update(message)
+        if not message:
+            if self.live_shown:
+                self.live_shown = False
+                self.current_image = None
+                self.preview.clear()
+            return
+        if self.live_shown and box is None:
+            return
         
-        # Update the image label
-        self.image_label.configure(image=ctk_image, text="")
-        self.image_label.image = ctk_image  # Keep a reference
+        pixels = self.live_encoder.pixels
+        if self.live_shown:
+            self.preview.update_image(pixels, box)
+        else:
+            self.preview.set_image(pixels)
+        self.live_shown = True
+        self.current_image = None
     
     def update_status(self, message):
         self.status_label.configure(text=message)
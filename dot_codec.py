@@ -0,0 +1,2720 @@
+"""
+Dot-grid codec shared by crypto_app.py, crypting.py, decrypting.py and batch.py.
+
+Importing this module is cheap: it does not touch Tk, and Pillow/NumPy are
+only imported the first time a function needs them, so short-lived worker
+processes pay for them only if they actually encode or decode.
+"""
+import importlib
+import io
+import math
+import os
+import struct
+import time
+import zlib
+
+
+class _LazyModule:
+    """
+    Stand-in for a heavy module: the first attribute access imports it and
+    rebinds the module-level name, so later lookups cost nothing extra.
+    """
+
+    def __init__(self, name, module_name):
+        self._name = name
+        self._module_name = module_name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._module_name)
+        globals()[self._name] = module
+        return getattr(module, attr)
+
+np = _LazyModule("np", "numpy")
+Image = _LazyModule("Image", "PIL.Image")
+ImageDraw = _LazyModule("ImageDraw", "PIL.ImageDraw")
+
+# ---- Constants ----
+# Colors (RGB)
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+GRAY = (128, 128, 128)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+RED = (255, 0, 0)
+COLORS = [BLACK, WHITE, GRAY, GREEN, BLUE, RED]
+
+# Dot grid settings
+DOT_SIZE = 10
+GRID_WIDTH = 3
+GRID_HEIGHT = 3
+GRID_SPACING = 5
+CHAR_SPACING = 20
+ROW_SPACING = 10
+CHARS_PER_ROW = 8
+# Width / height that planned layouts (chars_per_row=None) aim for
+PLAN_ASPECT = 4 / 3
+
+# Glyph rows processed between progress callbacks
+PROGRESS_BAND_ROWS = 64
+
+# Background color
+BG_COLOR = (200, 200, 200)
+
+# Define patterns for letters
+DOT_PATTERNS = {
+    'T': [WHITE, GRAY, WHITE, None, BLACK, WHITE, BLACK, BLACK, None],
+    'H': [WHITE, GRAY, WHITE, BLACK, BLACK, WHITE, BLACK, None, None],
+    'I': [None, BLACK, None, WHITE, BLACK, None, WHITE, BLUE, WHITE],
+    'S': [None, BLUE, None, WHITE, WHITE, WHITE, None, BLACK, BLACK],
+    'M': [WHITE, WHITE, WHITE, BLACK, WHITE, BLACK, BLUE, WHITE, None],
+    'E': [WHITE, GREEN, None, None, BLACK, None, WHITE, WHITE, WHITE],
+    'W': [WHITE, WHITE, None, WHITE, BLACK, BLACK, WHITE, BLACK, None],
+    'U': [BLACK, WHITE, WHITE, GREEN, WHITE, WHITE, WHITE, GRAY, WHITE],
+    'O': [BLACK, BLACK, BLACK, None, WHITE, WHITE, None, GRAY, None],
+    'C': [None, BLACK, None, GREEN, GRAY, None, BLACK, BLACK, BLACK],
+    'F': [WHITE, WHITE, WHITE, WHITE, BLUE, BLACK, None, None, BLACK],
+    'R': [WHITE, BLUE, WHITE, WHITE, WHITE, BLACK, BLACK, None, BLACK],
+    'A': [WHITE, WHITE, None, None, GRAY, WHITE, None, WHITE, WHITE],
+    'L': [WHITE, WHITE, WHITE, None, RED, WHITE, None, BLACK, BLACK],
+    'P': [WHITE, WHITE, WHITE, BLACK, None, WHITE, BLACK, BLACK, BLACK],
+    'B': [None, BLACK, None, BLACK, BLUE, BLACK, BLACK, WHITE, None],
+    'N': [WHITE, GRAY, WHITE, BLACK, WHITE, None, None, BLACK, BLACK],
+    'D': [GRAY, WHITE, BLACK, None, RED, BLACK, BLUE, None, None],
+    'G': [GRAY, BLACK, WHITE, None, GREEN, RED, BLUE, None, None],
+    'J': [BLACK, GRAY, WHITE, None, RED, BLUE, GREEN, None, None],
+    'K': [WHITE, GRAY, BLACK, None, BLUE, RED, GREEN, None, None],
+    'Q': [GRAY, WHITE, BLACK, None, GREEN, RED, BLUE, None, None],
+    'V': [BLACK, GRAY, WHITE, None, BLUE, GREEN, RED, None, None],
+    'X': [WHITE, BLACK, GRAY, None, RED, BLUE, GREEN, None, None],
+    'Y': [GRAY, BLACK, WHITE, None, BLUE, RED, GREEN, None, None],
+    'Z': [WHITE, GRAY, BLACK, None, RED, GREEN, BLUE, None, None],
+    ' ': [None, None, None, None, None, None, None, None, None]
+}
+
+# Build reverse lookup: pattern-tuple → character
+PATTERN_TO_CHAR = {tuple(v): k for k, v in DOT_PATTERNS.items()}
+
+# ---- Helper Functions ----
+def color_distance(color1, color2):
+    """Calculate Euclidean distance between two RGB colors"""
+    if color1 is None or color2 is None:
+        return 0 if color1 == color2 else 999
+    r1, g1, b1 = color1
+    r2, g2, b2 = color2
+    return math.sqrt((r1 - r2) ** 2 + (g1 - g2) ** 2 + (b1 - b2) ** 2)
+
+def find_closest_color(pixel, bg_color):
+    """Find the closest matching color from the predefined colors or None for bg"""
+    if pixel is None:
+        return None
+        
+    # If it's close to the background color, consider it None
+    if color_distance(pixel, bg_color) < 30:  # Threshold for background
+        return None
+        
+    # Find the closest color from our defined palette
+    closest = None
+    min_dist = float('inf')
+    for color in COLORS:
+        dist = color_distance(pixel, color)
+        if dist < min_dist:
+            min_dist = dist
+            closest = color
+    return closest
+
+def match_pattern(extracted_pattern, patterns_dict):
+    """Find the best match for an extracted pattern from the patterns dictionary"""
+    best_match = None
+    best_score = float('inf')
+    
+    for pattern, char in patterns_dict.items():
+        score = 0
+        for i, (p1, p2) in enumerate(zip(extracted_pattern, pattern)):
+            score += color_distance(p1, p2)
+        
+        if score < best_score:
+            best_score = score
+            best_match = char
+            
+    return best_match
+
+class Cancelled(Exception):
+    """Raised from a progress callback to abort an in-flight encode or decode."""
+
+# ---- Instrumentation ----
+class _StageTimer:
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = self.stats.seconds
+        seconds[self.name] = seconds.get(self.name, 0.0) + time.perf_counter() - self.start
+
+class CodecStats:
+    """
+    Optional profiler filled in by the encode and decode functions when passed
+    as stats=. seconds holds wall time per stage (load, convert, render,
+    compress, inflate, sample, classify, match); counts holds cells, exact_hits,
+    fuzzy_fallbacks, unknown_chars, chars_encoded and blank_chars_trimmed. One
+    instance may be reused across calls; values accumulate.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def stage(self, name):
+        """Context manager that adds the wall time of its body to stage name."""
+        return _StageTimer(self, name)
+
+    def add(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, other):
+        """Add the stages and counters of another CodecStats or its as_dict() form."""
+        if isinstance(other, CodecStats):
+            other = other.as_dict()
+        for name, seconds in other["seconds"].items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        for name, n in other["counts"].items():
+            self.add(name, n)
+
+    def exact_hit_ratio(self):
+        """Fraction of decoded cells that matched a pattern exactly, or None before any decode."""
+        matched = self.counts.get("exact_hits", 0) + self.counts.get("fuzzy_fallbacks", 0)
+        return self.counts.get("exact_hits", 0) / matched if matched else None
+
+    def as_dict(self):
+        return {
+            "seconds": dict(self.seconds),
+            "counts": dict(self.counts),
+            "exact_hit_ratio": self.exact_hit_ratio(),
+        }
+
+    def to_prometheus(self, prefix="dot_codec"):
+        """Render the stats in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Wall time spent in each codec stage.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        for name, seconds in sorted(self.seconds.items()):
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {seconds:.9g}')
+        for name, n in sorted(self.counts.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {n}")
+        ratio = self.exact_hit_ratio()
+        if ratio is not None:
+            lines.append(f"# TYPE {prefix}_exact_hit_ratio gauge")
+            lines.append(f"{prefix}_exact_hit_ratio {ratio:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One-line human summary, e.g. for a status bar."""
+        parts = [", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.seconds.items())]
+        if self.counts.get("cache_hits"):
+            parts.append("cached")
+        if "cells" in self.counts:
+            parts.append(f"{self.counts['cells']} cells")
+        ratio = self.exact_hit_ratio()
+        if ratio is not None:
+            parts.append(f"{ratio:.1%} exact")
+        if self.counts.get("unknown_chars"):
+            parts.append(f"{self.counts['unknown_chars']} unknown")
+        return " | ".join(part for part in parts if part)
+
+class _NullStats:
+    """Stand-in used when no stats object is passed; every call is a no-op."""
+
+    class _NullStage:
+        def __enter__(self):
+            pass
+
+        def __exit__(self, *exc):
+            pass
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, n=1):
+        pass
+
+    def merge(self, other):
+        pass
+
+NULL_STATS = _NullStats()
+
+# ---- Compiled codebook ----
+# Each dot is stored as an index into COLORS, with EMPTY standing for "no dot",
+# and each 9-dot pattern packs into one integer code in base len(COLORS) + 1.
+EMPTY = len(COLORS)
+DOTS_PER_CHAR = GRID_WIDTH * GRID_HEIGHT
+COLOR_INDEX = {color: i for i, color in enumerate(COLORS)}
+COLOR_INDEX[None] = EMPTY
+
+def pattern_code(indices):
+    """Pack a sequence of palette indices (EMPTY for no dot) into an integer code."""
+    code = 0
+    for i in indices:
+        code = code * (EMPTY + 1) + int(i)
+    return code
+
+CODEBOOK_CHARS = list(DOT_PATTERNS)
+CODEBOOK = tuple(tuple(COLOR_INDEX[color] for color in pattern) for pattern in DOT_PATTERNS.values())
+CODE_TO_CHAR = {pattern_code(row): char for char, row in zip(CODEBOOK_CHARS, CODEBOOK)}
+
+# DOT_DISTANCE[i][j] is color_distance between palette entries i and j (999 for dot vs no dot)
+_PALETTE_ENTRIES = COLORS + [None]
+DOT_DISTANCE = [[color_distance(a, b) for b in _PALETTE_ENTRIES] for a in _PALETTE_ENTRIES]
+
+_codebook_arrays = None
+
+def codebook_arrays():
+    """
+    Build the NumPy forms of the codebook on first use: (codebook, code_weights,
+    position_cost), where position_cost[p, i, k] is the cost of seeing index i
+    at dot p when the glyph is CODEBOOK[k].
+    """
+    global _codebook_arrays
+    if _codebook_arrays is not None:
+        return _codebook_arrays
+    codebook = np.array(CODEBOOK, dtype=np.int64)
+    code_weights = (EMPTY + 1) ** np.arange(DOTS_PER_CHAR - 1, -1, -1, dtype=np.int64)
+    distance = np.array(DOT_DISTANCE, dtype=np.float64)
+    position_cost = np.stack([distance[:, codebook[:, p]] for p in range(DOTS_PER_CHAR)])
+    _codebook_arrays = (codebook, code_weights, position_cost)
+    return _codebook_arrays
+
+def cell_codes(cells):
+    """Pack an (n, 9) array of palette indices into n integer codes."""
+    return np.asarray(cells, dtype=np.int64) @ codebook_arrays()[1]
+
+def nearest_chars(cells):
+    """
+    Return the closest codebook character for each row of an (n, 9) index array.
+    Scores are summed position by position, in the same order as match_pattern,
+    so ties resolve to the same character.
+    """
+    position_cost = codebook_arrays()[2]
+    cells = np.asarray(cells, dtype=np.int64)
+    scores = np.zeros((len(cells), len(CODEBOOK_CHARS)))
+    for p in range(DOTS_PER_CHAR):
+        scores += position_cost[p, cells[:, p]]
+    return [CODEBOOK_CHARS[k] for k in scores.argmin(axis=1)]
+
+def lookup_chars(cells, stats=NULL_STATS):
+    """Decode an (n, 9) array of palette indices: exact code hits first, table-scored fallback for the rest."""
+    codes = cell_codes(cells)
+    unique_codes, first, inverse, counts = np.unique(
+        codes, return_index=True, return_inverse=True, return_counts=True
+    )
+    chars = [CODE_TO_CHAR.get(int(code)) for code in unique_codes]
+    misses = [i for i, char in enumerate(chars) if char is None]
+    if misses:
+        fuzzy = nearest_chars(np.asarray(cells)[first[misses]])
+        for i, char in zip(misses, fuzzy):
+            chars[i] = char
+    fallbacks = int(counts[misses].sum()) if misses else 0
+    stats.add("cells", len(codes))
+    stats.add("exact_hits", len(codes) - fallbacks)
+    stats.add("fuzzy_fallbacks", fallbacks)
+    return [chars[i] for i in inverse.reshape(-1)]
+
+# ---- Functions ----
+def draw_dot_grid(draw, x, y, pattern):
+    """Draw a 3x3 grid of colored dots at position (x, y), skipping None values."""
+    for row in range(GRID_HEIGHT):
+        for col in range(GRID_WIDTH):
+            color = pattern[row * GRID_WIDTH + col]
+            if color is None:
+                continue  # Skip drawing if color is None (mimics unused dots)
+            dot_x = x + col * (DOT_SIZE + GRID_SPACING)
+            dot_y = y + row * (DOT_SIZE + GRID_SPACING)
+            # Draw a circle (dot) at the calculated position
+            draw.ellipse(
+                [dot_x, dot_y, dot_x + DOT_SIZE, dot_y + DOT_SIZE],
+                fill=color
+            )
+
+def extract_dot_grid(img, x, y):
+    """
+    Sample the center of each DOT_SIZE×DOT_SIZE cell.
+    If it equals BG_COLOR, treat it as None; otherwise record the RGB tuple.
+    """
+    pat = []
+    for ry in range(GRID_HEIGHT):
+        for rx in range(GRID_WIDTH):
+            dot_x = x + rx * (DOT_SIZE + GRID_SPACING)
+            dot_y = y + ry * (DOT_SIZE + GRID_SPACING)
+            cx = dot_x + DOT_SIZE // 2
+            cy = dot_y + DOT_SIZE // 2
+            
+            # Ensure coordinates are within image bounds
+            if cx >= img.width or cy >= img.height:
+                pat.append(None)
+                continue
+                
+            pixel = img.getpixel((cx, cy))
+            closest_color = find_closest_color(pixel, BG_COLOR)
+            pat.append(closest_color)
+    return tuple(pat)
+
+def grid_pixel_size():
+    """Return the (width, height) in pixels of one character's dot grid."""
+    grid_w = GRID_WIDTH * (DOT_SIZE + GRID_SPACING) - GRID_SPACING
+    grid_h = GRID_HEIGHT * (DOT_SIZE + GRID_SPACING) - GRID_SPACING
+    return grid_w, grid_h
+
+def grid_shape(width, height):
+    """Return how many character (cols, rows) fit in an image of the given size."""
+    grid_w, grid_h = grid_pixel_size()
+    cols = (width + CHAR_SPACING) // (grid_w + CHAR_SPACING)
+    rows = (height + ROW_SPACING) // (grid_h + ROW_SPACING)
+    return cols, rows
+
+# ---- Glyph tile rendering ----
+# draw.ellipse includes its end coordinates, so every glyph spills one pixel
+# past grid_w/grid_h into the spacing; tiles are sized to one full cell pitch.
+_glyph_tile_cache = {}
+
+def glyph_tile(pattern):
+    """Return the cached (pitch_h, pitch_w, 3) tile for a pattern, drawn once with draw_dot_grid."""
+    key = tuple(pattern)
+    tile = _glyph_tile_cache.get(key)
+    if tile is None:
+        grid_w, grid_h = grid_pixel_size()
+        image = Image.new("RGB", (grid_w + CHAR_SPACING, grid_h + ROW_SPACING), color=BG_COLOR)
+        draw_dot_grid(ImageDraw.Draw(image), 0, 0, pattern)
+        tile = np.asarray(image)
+        _glyph_tile_cache[key] = tile
+    return tile
+
+def glyph_stack():
+    """Stack the tiles of every CODEBOOK_CHARS glyph, plus a blank tile at the end for skipped characters."""
+    tiles = [glyph_tile(DOT_PATTERNS[char]) for char in CODEBOOK_CHARS]
+    tiles.append(glyph_tile([None] * DOTS_PER_CHAR))
+    return np.stack(tiles)
+
+GLYPH_INDEX = {char: i for i, char in enumerate(CODEBOOK_CHARS)}
+BLANK_GLYPH = len(CODEBOOK_CHARS)
+
+def image_size(num_chars, chars_per_row=CHARS_PER_ROW):
+    """Return the (width, height) of the image that holds num_chars characters."""
+    grid_w, grid_h = grid_pixel_size()
+    num_rows = (num_chars + chars_per_row - 1) // chars_per_row
+    image_width = chars_per_row * (grid_w + CHAR_SPACING) - CHAR_SPACING
+    image_height = num_rows * (grid_h + ROW_SPACING) - ROW_SPACING
+    return image_width, image_height
+
+def glyph_indices(text):
+    """Map text to indices into glyph_stack(); unsupported characters get BLANK_GLYPH."""
+    return np.array([GLYPH_INDEX.get(char, BLANK_GLYPH) for char in text.upper()], dtype=np.intp)
+
+def glyph_cells(indices, codebook=None):
+    """The (n, 9) uint8 palette indices of glyph indices; the index past the last glyph is all EMPTY."""
+    rows = CODEBOOK if codebook is None else tuple(map(tuple, codebook.cells.tolist()))
+    table = np.array(rows + ((EMPTY,) * DOTS_PER_CHAR,), dtype=np.uint8)
+    return table[indices]
+
+def render_rows(indices, chars_per_row=CHARS_PER_ROW, width=None, out=None, stack=None):
+    """
+    Assemble whole glyph rows from a flat array of glyph indices, padding the
+    last row with blanks. Returns a (rows * pitch_h, width, 3) uint8 array,
+    written into out when given. stack defaults to glyph_stack(); its last
+    tile is the blank.
+    """
+    grid_w, grid_h = grid_pixel_size()
+    pitch_w, pitch_h = grid_w + CHAR_SPACING, grid_h + ROW_SPACING
+    if width is None:
+        width = chars_per_row * pitch_w - CHAR_SPACING
+    num_rows = (len(indices) + chars_per_row - 1) // chars_per_row
+    if stack is None:
+        stack = glyph_stack()
+    padded = np.full(num_rows * chars_per_row, len(stack) - 1, dtype=np.intp)
+    padded[:len(indices)] = indices
+    padded = padded.reshape(num_rows, chars_per_row)
+
+    if out is None:
+        out = np.empty((num_rows * pitch_h, width, 3), dtype=np.uint8)
+    canvas = out.reshape(num_rows, pitch_h, width, 3)
+    for col in range(chars_per_row):
+        x = col * pitch_w
+        w = min(pitch_w, width - x)
+        canvas[:, :, x:x + w] = stack[padded[:, col], :, :w]
+    return out
+
+def render_message(message, chars_per_row=CHARS_PER_ROW, progress=None, stats=None, codebook=None,
+                   aspect=PLAN_ASPECT, max_width=None, max_height=None):
+    """
+    Render message as a dot image by stamping cached glyph tiles; pixel-identical
+    to draw_dot_grid. progress(rows_done, rows_total) is called per band of glyph
+    rows; stats, a CodecStats, collects timings and counters. The layout goes
+    into image.info, which save_png writes out. codebook, a Codebook, replaces
+    the built-in DOT_PATTERNS.
+
+    With chars_per_row None the shape is planned: trailing blank glyphs are
+    left undrawn (the layout records them, so decoding restores them) and
+    plan_layout picks the columns from aspect, max_width and max_height.
+    """
+    if not message:
+        raise ValueError("Cannot encode an empty message")
+    stats = stats or NULL_STATS
+    # Upper-casing or escapes can lengthen the text ("ß" -> "SS"), so size by glyphs
+    indices, unknown = encode_glyphs(message, codebook)
+    trailing = 0
+    if chars_per_row is None:
+        trailing = trailing_blanks(indices, codebook)
+        indices = indices[:len(indices) - trailing]
+        chars_per_row = plan_layout(len(indices), aspect, max_width, max_height)
+        stats.add("blank_chars_trimmed", trailing)
+    stack = None if codebook is None else codebook.stack()
+    image_width, image_height = image_size(len(indices), chars_per_row)
+    grid_w, grid_h = grid_pixel_size()
+    pitch_h = grid_h + ROW_SPACING
+    num_rows = (len(indices) + chars_per_row - 1) // chars_per_row
+    stats.add("chars_encoded", len(indices))
+    stats.add("unknown_chars", unknown)
+
+    canvas = np.empty((num_rows * pitch_h, image_width, 3), dtype=np.uint8)
+    band_rows = num_rows if progress is None else PROGRESS_BAND_ROWS
+    for row in range(0, num_rows, band_rows):
+        stop = min(row + band_rows, num_rows)
+        with stats.stage("render"):
+            render_rows(
+                indices[row * chars_per_row:stop * chars_per_row], chars_per_row,
+                image_width, out=canvas[row * pitch_h:stop * pitch_h], stack=stack
+            )
+        if progress is not None:
+            progress(stop, num_rows)
+    with stats.stage("convert"):
+        image = Image.fromarray(canvas[:image_height])
+    crc = zlib.crc32(glyph_text(message, codebook)[:len(indices)].encode("utf-8"))
+    image.info[LAYOUT_TEXT_KEY] = layout_text(make_layout(
+        len(indices), crc, chars_per_row,
+        codebook=CODEBOOK_VERSION if codebook is None else codebook.version, trailing_spaces=trailing,
+    ))
+    return image
+
+# ---- Incremental encoding ----
+def common_prefix_length(a, b):
+    """Length of the common prefix of two strings, compared slice-wise at C speed in O(n)."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def common_suffix_length(a, b):
+    """Length of the common suffix of two strings."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:len(a) - lo] == b[len(b) - mid:len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+class IncrementalEncoder:
+    """
+    Keeps the canvas of the last text passed to update() and re-stamps only
+    the glyph cells whose character changed. The canvas grows and shrinks by
+    whole glyph rows inside a buffer whose row capacity doubles, so typing
+    costs time proportional to the edit, not to the message length.
+    """
+
+    def __init__(self, chars_per_row=CHARS_PER_ROW):
+        grid_w, grid_h = grid_pixel_size()
+        self.chars_per_row = chars_per_row
+        self.pitch_w, self.pitch_h = grid_w + CHAR_SPACING, grid_h + ROW_SPACING
+        self.width = chars_per_row * self.pitch_w - CHAR_SPACING
+        self.text = ""  # upper-cased, so text positions are glyph positions
+        self.indices = np.empty(0, dtype=np.intp)
+        self.buffer = np.empty((0, self.width, 3), dtype=np.uint8)
+        self.stack = glyph_stack()
+
+    @property
+    def rows(self):
+        return (len(self.indices) + self.chars_per_row - 1) // self.chars_per_row
+
+    @property
+    def pixels(self):
+        """The current image as an (H, W, 3) view into the buffer; copy it before the next update."""
+        return self.buffer[:max(0, self.rows * self.pitch_h - ROW_SPACING)]
+
+    def image(self):
+        """A PIL copy of the current image, identical to render_message(text)."""
+        image = Image.fromarray(self.pixels)
+        image.info[LAYOUT_TEXT_KEY] = layout_text(
+            make_layout(len(self.indices), text_crc(self.text), self.chars_per_row)
+        )
+        return image
+
+    def update(self, text):
+        """Re-render for text and return the changed (x0, y0, x1, y1) pixel box, or None."""
+        text = text.upper()
+        old_text, old = self.text, self.indices
+        if text == old_text:
+            return None
+        prefix = common_prefix_length(old_text, text)
+        suffix = common_suffix_length(old_text[prefix:], text[prefix:])
+        new = np.concatenate([
+            old[:prefix], glyph_indices(text[prefix:len(text) - suffix]), old[len(old) - suffix:]
+        ])
+
+        # Cells after an insertion or deletion shift; only those whose glyph differs are redrawn
+        overlap = min(len(old), len(new))
+        common = len(old) - suffix if len(new) == len(old) else overlap
+        changed = prefix + np.flatnonzero(old[prefix:common] != new[prefix:common])
+        changed = np.concatenate([changed, np.arange(overlap, max(len(old), len(new)))])
+        old_rows = self.rows
+        self.text, self.indices = text, new
+        if not len(changed):
+            return None
+
+        self._reserve(self.rows, old_rows)
+        first, last = changed[0] // self.chars_per_row, changed[-1] // self.chars_per_row
+        if 2 * len(changed) >= (last - first + 1) * self.chars_per_row:
+            # Mostly new or shifted cells: re-render whole rows a band at a time
+            for row in range(first, min(last + 1, self.rows), PROGRESS_BAND_ROWS):
+                stop = min(row + PROGRESS_BAND_ROWS, self.rows)
+                render_rows(
+                    new[row * self.chars_per_row:stop * self.chars_per_row], self.chars_per_row,
+                    self.width, out=self.buffer[row * self.pitch_h:stop * self.pitch_h]
+                )
+        else:
+            # Rows coming into use may hold stale pixels from a longer text
+            self.buffer[old_rows * self.pitch_h:self.rows * self.pitch_h] = BG_COLOR
+            glyphs = np.full(len(changed), BLANK_GLYPH, dtype=np.intp)
+            inside = changed < len(new)
+            glyphs[inside] = new[changed[inside]]
+            rows, cols = np.divmod(changed, self.chars_per_row)
+            canvas = self.buffer.reshape(-1, self.pitch_h, self.width, 3)
+            for col in np.unique(cols):
+                x = col * self.pitch_w
+                w = min(self.pitch_w, self.width - x)
+                selected = cols == col
+                canvas[rows[selected], :, x:x + w] = self.stack[glyphs[selected], :, :w]
+        return 0, int(first) * self.pitch_h, self.width, (int(last) + 1) * self.pitch_h
+
+    def _reserve(self, rows, used_rows):
+        """Make room for rows glyph rows, doubling capacity and keeping the first used_rows."""
+        capacity = len(self.buffer) // self.pitch_h
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, 16)
+        buffer = np.empty((capacity * self.pitch_h, self.width, 3), dtype=np.uint8)
+        buffer[:used_rows * self.pitch_h] = self.buffer[:used_rows * self.pitch_h]
+        self.buffer = buffer
+
+# ---- Layout metadata ----
+# tEXt key holding the JSON layout an image was encoded with
+LAYOUT_TEXT_KEY = "dot-codec-layout"
+LAYOUT_VERSION = 1
+# Bumped whenever DOT_PATTERNS changes meaning
+CODEBOOK_VERSION = 1
+LAYOUT_FIELDS = (
+    "version", "codebook", "dot_size", "grid_spacing", "char_spacing", "row_spacing",
+    "chars_per_row", "chars", "crc32",
+)
+
+class ChecksumError(ValueError):
+    """The decoded text does not match the checksum in the image's layout metadata."""
+
+    def __init__(self, message, text=None):
+        super().__init__(message)
+        self.text = text
+
+def text_crc(text, crc=0):
+    """CRC-32 of the text a clean decode of text yields; pass the previous value to continue a running CRC."""
+    return zlib.crc32(normalize_message(text).encode("utf-8"), crc)
+
+def make_layout(num_chars, crc, chars_per_row=CHARS_PER_ROW, dot_size=DOT_SIZE, grid_spacing=GRID_SPACING,
+                char_spacing=CHAR_SPACING, row_spacing=ROW_SPACING, codebook=CODEBOOK_VERSION, trailing_spaces=0):
+    """
+    Layout metadata for an image holding num_chars glyphs whose glyph_crc is
+    crc. trailing_spaces counts spaces dropped from the end of the message
+    instead of being drawn; decoders append them after the checksum passes.
+    """
+    layout = {
+        "version": LAYOUT_VERSION,
+        "codebook": codebook,
+        "dot_size": dot_size,
+        "grid_spacing": grid_spacing,
+        "char_spacing": char_spacing,
+        "row_spacing": row_spacing,
+        "chars_per_row": chars_per_row,
+        "chars": num_chars,
+        "crc32": f"{crc & 0xFFFFFFFF:08x}",
+    }
+    if trailing_spaces:
+        layout["trailing_spaces"] = trailing_spaces
+    return layout
+
+def layout_text(layout):
+    import json
+    return json.dumps(layout, separators=(",", ":"))
+
+def parse_layout(value):
+    """Parse and validate a LAYOUT_TEXT_KEY value; ValueError if this decoder cannot honour it."""
+    import json
+    try:
+        layout = json.loads(value)
+    except ValueError:
+        raise ValueError(f"Malformed layout metadata: {value!r}")
+    if not isinstance(layout, dict) or any(field not in layout for field in LAYOUT_FIELDS):
+        raise ValueError(f"Incomplete layout metadata: {value!r}")
+    if layout["version"] != LAYOUT_VERSION:
+        raise ValueError(f"Unsupported layout metadata version: {layout['version']}")
+    if layout["codebook"] != CODEBOOK_VERSION:
+        load_codebook(layout["codebook"])  # ValueError unless it is installed
+    if layout["chars_per_row"] <= 0 or layout["chars"] < 0 or layout.get("trailing_spaces", 0) < 0:
+        raise ValueError(f"Invalid layout metadata: {value!r}")
+    return layout
+
+def image_layout(img):
+    """The layout recorded in a PIL image's text chunks, or None."""
+    value = img.info.get(LAYOUT_TEXT_KEY)
+    return parse_layout(value) if value is not None else None
+
+def read_layout(path):
+    """The layout recorded in the PNG at path, read without inflating any pixels, or None."""
+    value = png_text(path).get(LAYOUT_TEXT_KEY)
+    return parse_layout(value) if value is not None else None
+
+def check_layout(text, layout):
+    """Raise ChecksumError unless text matches the layout's character count and checksum."""
+    # Decoded text is already normalized, so it is hashed as is; a stray "?" must not pass as a space
+    if len(text) != layout["chars"] or f"{zlib.crc32(text.encode('utf-8')):08x}" != layout["crc32"]:
+        raise ChecksumError(f"Decoded text does not match the image checksum {layout['crc32']}", text)
+
+def layout_tail(layout):
+    """The trailing spaces a layout records as dropped from the drawn glyphs ("" without a layout)."""
+    return " " * layout.get("trailing_spaces", 0) if layout is not None else ""
+
+def save_png(image, fp):
+    """
+    Save an encoded image to fp (a path or binary file) as PNG, keeping its
+    layout metadata; compact images go through save_compact. Pillow's plain
+    save() drops the metadata.
+    """
+    if compact_block_size(image):
+        save_compact(image, fp)
+        return
+    from PIL import PngImagePlugin
+    info = PngImagePlugin.PngInfo()
+    if LAYOUT_TEXT_KEY in image.info:
+        info.add_text(LAYOUT_TEXT_KEY, image.info[LAYOUT_TEXT_KEY])
+    image.save(fp, "PNG", pnginfo=info)
+
+# ---- Layout planning ----
+def plan_layout(num_chars, aspect=PLAN_ASPECT, max_width=None, max_height=None):
+    """
+    Choose chars_per_row for an image of num_chars glyphs. Only tight shapes
+    are considered, the fewest columns that hold num_chars in a given number
+    of rows, so at most the last row has blank cells. Of those that fit in
+    max_width x max_height pixels, the one whose width / height is closest to
+    aspect wins, ties going to the smaller image; with aspect None the image
+    with the fewest pixels wins outright. ValueError if nothing fits.
+    """
+    if num_chars <= 0:
+        return 1
+    # Tight column counts are ceil(n / rows); small row and column counts
+    # together cover all of them in O(sqrt(n))
+    small = np.arange(1, math.isqrt(num_chars) + 2)
+    rows = -(-num_chars // np.concatenate([small, -(-num_chars // small)]))
+    cols = np.unique(-(-num_chars // rows))
+    width, height = image_size(num_chars, cols)
+    fits = np.ones(len(cols), dtype=bool)
+    if max_width is not None:
+        fits &= width <= max_width
+    if max_height is not None:
+        fits &= height <= max_height
+    if not fits.any():
+        raise ValueError(f"{num_chars} characters do not fit in {max_width or 'any'} x {max_height or 'any'} px")
+    cols, width, height = cols[fits], width[fits], height[fits]
+    area = width.astype(np.float64) * height
+    if aspect is None:
+        return int(cols[area.argmin()])
+    skew = np.abs(np.log(width / height) - math.log(aspect))
+    return int(cols[np.lexsort((area, skew))[0]])
+
+def trailing_blanks(indices, codebook=None):
+    """
+    How many glyphs at the end of indices draw no dots (spaces and unknown
+    characters); at least one glyph is always kept so the image is not empty.
+    """
+    blank = (glyph_cells(np.arange(BLANK_GLYPH + 1 if codebook is None else len(codebook) + 1), codebook)
+             == EMPTY).all(axis=1)
+    drawn = np.flatnonzero(~blank[indices])
+    keep = drawn[-1] + 1 if len(drawn) else min(1, len(indices))
+    return len(indices) - int(keep)
+
+# ---- Extended codebooks ----
+# Codebooks beyond the built-in version 1 are compiled by codebook.py and
+# stored one file per version. The file is CODEBOOK_HEADER followed by the
+# sorted pattern codes (int64), the glyph each code belongs to (int32), the
+# pairwise pattern distances (float32), the glyph characters (uint32 code
+# points) and the patterns themselves (uint8 palette indices).
+CODEBOOK_MAGIC = b"DOTBOOK\0"
+CODEBOOK_FILE_VERSION = 1
+# magic, file version, codebook version, glyph count
+CODEBOOK_HEADER = struct.Struct("<8sHHI8x")
+# ESCAPE_CHAR's glyph followed by ESCAPE_DIGITS hex digit glyphs spells a
+# code point outside the alphabet
+ESCAPE_CHAR = "\x1b"
+ESCAPE_DIGITS = 6
+HEX_DIGITS = "0123456789ABCDEF"
+
+class Codebook:
+    """
+    A compiled codebook: glyph i is chars[i], drawn as cells[i], a row of
+    DOTS_PER_CHAR palette indices (EMPTY for no dot). The space glyph has no
+    dots. codes and order form the reverse index (sorted integer pattern
+    codes and their glyphs) and distance holds the match_pattern distance
+    between every pair of glyphs. Text is decoded exactly as written; with
+    an escape glyph, characters outside the alphabet are spelled as escape
+    sequences, otherwise they become spaces.
+    """
+
+    def __init__(self, version, chars, cells, codes=None, order=None, distance=None):
+        self.version = version
+        self.chars = list(chars)
+        self.cells = np.asarray(cells, dtype=np.uint8)
+        if codes is None:
+            codes = cell_codes(self.cells)
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            codes = codes[order]
+        self.codes, self.order = codes, order
+        self.distance = pattern_distances(self.cells) if distance is None else distance
+        self.index = {char: i for i, char in enumerate(self.chars)}
+        if " " not in self.index:
+            raise ValueError("A codebook needs a space glyph")
+        self.blank = self.index[" "]
+        self.escape = self.index.get(ESCAPE_CHAR)
+        # Only alphabets without lowercase letters fold case, as version 1 does
+        self.fold_case = not any(char.islower() for char in self.chars)
+        self._char_array = None
+        self._position_cost = None
+
+    def __len__(self):
+        return len(self.chars)
+
+    @property
+    def min_distance(self):
+        """The smallest distance between two glyphs, which bounds the noise a cell survives."""
+        if len(self) < 2:
+            return float("inf")
+        return float((self.distance + np.diag(np.full(len(self), np.inf))).min())
+
+    def encode(self, text):
+        """Return (glyph indices, number of characters escaped or blanked) for text."""
+        indices = []
+        unknown = 0
+        for char in text:
+            i = self.index.get(char) if char != ESCAPE_CHAR else None
+            if i is None and self.fold_case:
+                i = self.index.get(char.upper())
+            if i is None:
+                unknown += 1
+                if self.escape is not None:
+                    indices.append(self.escape)
+                    indices.extend(self.index[digit] for digit in f"{ord(char):0{ESCAPE_DIGITS}X}")
+                    continue
+                i = self.blank
+            indices.append(i)
+        return np.array(indices, dtype=np.intp), unknown
+
+    def glyph_text(self, text):
+        """The glyph characters text encodes to, escapes spelled out; what the layout checksum covers."""
+        return "".join(self.chars[i] for i in self.encode(text)[0])
+
+    def normalize(self, text):
+        """Return the text a clean decode of text yields."""
+        return self.unescape(self.glyph_text(text))
+
+    def lookup(self, cells, stats=NULL_STATS):
+        """Decode an (n, 9) array of palette indices to glyph text: exact code hits, then nearest patterns."""
+        cells = np.asarray(cells)
+        if not len(cells):
+            return ""
+        codes = cell_codes(cells)
+        pos = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+        hit = self.codes[pos] == codes
+        glyphs = self.order[pos]
+        misses = np.flatnonzero(~hit)
+        if len(misses):
+            glyphs[misses] = self.nearest(cells[misses])
+        stats.add("cells", len(codes))
+        stats.add("exact_hits", len(codes) - len(misses))
+        stats.add("fuzzy_fallbacks", len(misses))
+        if self._char_array is None:
+            self._char_array = np.array(self.chars)
+        return "".join(self._char_array[glyphs].tolist())
+
+    def nearest(self, cells):
+        """The glyph with the smallest summed dot distance for each row of cells."""
+        if self._position_cost is None:
+            distance = np.array(DOT_DISTANCE, dtype=np.float64)
+            self._position_cost = np.stack([distance[:, self.cells[:, p]] for p in range(DOTS_PER_CHAR)])
+        cells = np.asarray(cells, dtype=np.intp)
+        scores = np.zeros((len(cells), len(self)))
+        for p in range(DOTS_PER_CHAR):
+            scores += self._position_cost[p, cells[:, p]]
+        return scores.argmin(axis=1)
+
+    def unescape(self, text):
+        """Replace escape sequences by the characters they spell; broken ones become U+FFFD."""
+        if self.escape is None or ESCAPE_CHAR not in text:
+            return text
+        parts = text.split(ESCAPE_CHAR)
+        out = [parts[0]]
+        for part in parts[1:]:
+            digits = part[:ESCAPE_DIGITS]
+            code = int(digits, 16) if len(digits) == ESCAPE_DIGITS and all(d in HEX_DIGITS for d in digits) else -1
+            if 0 <= code <= 0x10FFFF and not 0xD800 <= code <= 0xDFFF:
+                out.append(chr(code) + part[ESCAPE_DIGITS:])
+            else:
+                out.append("\ufffd" + part)  # keep the glyphs that followed a broken escape
+        return "".join(out)
+
+    def unescape_stream(self, chunks):
+        """unescape() over a stream of glyph text, holding back escape sequences cut by a chunk boundary."""
+        pending = ""
+        for chunk in chunks:
+            text = pending + chunk
+            cut = text.rfind(ESCAPE_CHAR, max(0, len(text) - ESCAPE_DIGITS))
+            if cut < 0:
+                cut = len(text)
+            pending = text[cut:]
+            if cut:
+                yield self.unescape(text[:cut])
+        if pending:
+            yield self.unescape(pending)
+
+    def patterns(self):
+        """{pattern of colours: char}, the form match_pattern takes."""
+        return {tuple(_PALETTE_ENTRIES[i] for i in row): char for row, char in zip(self.cells.tolist(), self.chars)}
+
+    def stack(self):
+        """Glyph tiles in glyph order, plus a blank tile at the end for padding."""
+        tiles = [glyph_tile([_PALETTE_ENTRIES[i] for i in row]) for row in self.cells.tolist()]
+        tiles.append(glyph_tile([None] * DOTS_PER_CHAR))
+        return np.stack(tiles)
+
+    def save(self, path):
+        """Write the compiled tables to path."""
+        header = CODEBOOK_HEADER.pack(CODEBOOK_MAGIC, CODEBOOK_FILE_VERSION, self.version, len(self))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(header)
+            fp.write(np.ascontiguousarray(self.codes, dtype="<i8").tobytes())
+            fp.write(np.ascontiguousarray(self.order, dtype="<i4").tobytes())
+            fp.write(np.ascontiguousarray(self.distance, dtype="<f4").tobytes())
+            fp.write(np.array([ord(char) for char in self.chars], dtype="<u4").tobytes())
+            fp.write(self.cells.tobytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read tables written by save() without recomputing anything."""
+        with open(path, "rb") as fp:
+            data = fp.read()
+        if len(data) < CODEBOOK_HEADER.size or not data.startswith(CODEBOOK_MAGIC):
+            raise ValueError(f"Not a codebook file: {path}")
+        _, file_version, version, n = CODEBOOK_HEADER.unpack_from(data)
+        if file_version != CODEBOOK_FILE_VERSION:
+            raise ValueError(f"Unsupported codebook file version: {file_version}")
+        sizes = ((np.dtype("<i8"), n), (np.dtype("<i4"), n), (np.dtype("<f4"), n * n),
+                 (np.dtype("<u4"), n), (np.dtype(np.uint8), n * DOTS_PER_CHAR))
+        if len(data) != CODEBOOK_HEADER.size + sum(dtype.itemsize * count for dtype, count in sizes):
+            raise ValueError(f"Truncated codebook file: {path}")
+        arrays = []
+        offset = CODEBOOK_HEADER.size
+        for dtype, count in sizes:
+            arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += dtype.itemsize * count
+        codes, order, distance, chars, cells = arrays
+        return cls(version, [chr(c) for c in chars.tolist()], cells.reshape(n, DOTS_PER_CHAR),
+                   codes, order, distance.reshape(n, n))
+
+def pattern_distances(cells):
+    """The (n, n) match_pattern distances between the rows of an (n, 9) palette index array."""
+    distance = np.array(DOT_DISTANCE, dtype=np.float32)
+    cells = np.asarray(cells, dtype=np.intp)
+    out = np.zeros((len(cells), len(cells)), dtype=np.float32)
+    for p in range(DOTS_PER_CHAR):
+        out += distance[cells[:, None, p], cells[None, :, p]]
+    return out
+
+def builtin_codebook():
+    """Version 1, the hand-written DOT_PATTERNS, as a Codebook (the codec itself uses the module tables)."""
+    return Codebook(CODEBOOK_VERSION, CODEBOOK_CHARS, CODEBOOK)
+
+def codebook_path(version):
+    """Where codebook version lives: DOT_CODEC_CODEBOOK_DIR, or codebooks/ under the cache directory."""
+    directory = os.environ.get("DOT_CODEC_CODEBOOK_DIR") or os.path.join(CACHE_DIR, "codebooks")
+    return os.path.join(directory, f"codebook-v{version}.bin")
+
+_codebooks = {}
+
+def load_codebook(version):
+    """Return codebook version, loaded once per process; ValueError if it is not installed."""
+    codebook = _codebooks.get(version)
+    if codebook is None:
+        if version == CODEBOOK_VERSION:
+            codebook = builtin_codebook()
+        else:
+            path = codebook_path(version)
+            if not os.path.exists(path):
+                raise ValueError(f"Codebook version {version} is not installed (expected {path}); "
+                                 f"compile it with codebook.py")
+            codebook = Codebook.load(path)
+            if codebook.version != version:
+                raise ValueError(f"{path} holds codebook version {codebook.version}, not {version}")
+        _codebooks[version] = codebook
+    return codebook
+
+def layout_codebook(layout):
+    """The extended Codebook an image's layout names, or None for the built-in version 1 tables."""
+    if layout is None or layout["codebook"] == CODEBOOK_VERSION:
+        return None
+    return load_codebook(layout["codebook"])
+
+def encode_glyphs(text, codebook=None):
+    """Return (glyph indices, unknown character count) for text under codebook (None for version 1)."""
+    if codebook is None:
+        indices = glyph_indices(text)
+        return indices, int((indices == BLANK_GLYPH).sum())
+    return codebook.encode(text)
+
+def glyph_text(text, codebook=None):
+    """The text the glyphs of text decode to before unescaping: what the layout checksum covers."""
+    return normalize_message(text) if codebook is None else codebook.glyph_text(text)
+
+def glyph_crc(text, codebook=None, crc=0):
+    """text_crc generalised to extended codebooks, whose checksum covers the glyph text."""
+    return zlib.crc32(glyph_text(text, codebook).encode("utf-8"), crc)
+
+def cells_text(cells, stats=NULL_STATS, codebook=None):
+    """Decode (n, 9) palette indices to glyph text: lowercase for version 1, as written for extended codebooks."""
+    if codebook is None:
+        return "".join(lookup_chars(cells, stats)).lower()
+    return codebook.lookup(cells, stats)
+
+def unescape_text(text, codebook=None):
+    return text if codebook is None else codebook.unescape(text)
+
+# ---- Streaming PNG encoder ----
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+IDAT_CHUNK_SIZE = 1 << 16
+STREAM_READ_SIZE = 1 << 16
+
+def png_chunk(tag, data):
+    """Serialize one PNG chunk: length, tag, data and CRC."""
+    return (
+        struct.pack(">I", len(data)) + tag + data
+        + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+class PNGStreamWriter:
+    """
+    Write an 8-bit RGB PNG scanline by scanline. Compressed data goes out in
+    IDAT chunks as soon as IDAT_CHUNK_SIZE bytes are ready, so memory stays at
+    one batch of scanlines plus the zlib state. If height is None the file
+    object must be seekable; IHDR is patched with the real height on close().
+    """
+
+    def __init__(self, fp, width, height=None, compress_level=6):
+        if height is None and not (hasattr(fp, "seekable") and fp.seekable()):
+            raise ValueError("A seekable output is required when the image height is not known up front")
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = bytearray()
+        self._previous = np.zeros(width * 3, dtype=np.uint8)
+
+        fp.write(PNG_SIGNATURE)
+        self._ihdr_offset = fp.tell() if height is None else None
+        self._write_ihdr(height or 0)
+
+    def _write_ihdr(self, height):
+        self.fp.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, height, 8, 2, 0, 0, 0)))
+
+    def _flush_idat(self, final=False):
+        while len(self._pending) >= IDAT_CHUNK_SIZE or (final and self._pending):
+            self.fp.write(png_chunk(b"IDAT", bytes(self._pending[:IDAT_CHUNK_SIZE])))
+            del self._pending[:IDAT_CHUNK_SIZE]
+
+    def write_rows(self, rows):
+        """Append an (n, width, 3) uint8 array of scanlines."""
+        rows = np.asarray(rows, dtype=np.uint8).reshape(len(rows), self.width * 3)
+        if not len(rows):
+            return
+        # "Up" filter: flat dot art turns into long runs of zeros
+        filtered = np.empty((len(rows), self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        filtered[0, 1:] = rows[0] - self._previous
+        filtered[1:, 1:] = rows[1:] - rows[:-1]
+        self._previous = rows[-1].copy()
+        self._pending += self._compressor.compress(filtered.tobytes())
+        self.rows_written += len(rows)
+        self._flush_idat()
+
+    def close(self, text=None):
+        """
+        Finish the zlib stream, write IEND and fix up the height if it was
+        deferred. text, a dict, is written as tEXt chunks after the image data.
+        """
+        if self.height is not None and self.rows_written != self.height:
+            raise ValueError(f"Expected {self.height} rows, got {self.rows_written}")
+        self._pending += self._compressor.flush()
+        self._flush_idat(final=True)
+        for key, value in (text or {}).items():
+            self.fp.write(png_chunk(b"tEXt", key.encode("latin-1") + b"\0" + value.encode("latin-1")))
+        self.fp.write(png_chunk(b"IEND", b""))
+        if self._ihdr_offset is not None:
+            end = self.fp.tell()
+            self.fp.seek(self._ihdr_offset)
+            self._write_ihdr(self.rows_written)
+            self.fp.seek(end)
+
+def iter_text(source, chunk_size=STREAM_READ_SIZE):
+    """Yield text chunks from a string, a file-like object with read(), or an iterable of strings."""
+    if isinstance(source, str):
+        yield source
+        return
+    read = getattr(source, "read", None)
+    if read is None:
+        yield from source
+        return
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def encrypt_stream(source, fp, num_chars=None, chars_per_row=CHARS_PER_ROW, band_rows=16,
+                   compress_level=6, stats=None, codebook=None):
+    """
+    Encode text from source into a PNG written to fp (a path or binary file)
+    band_rows glyph rows at a time, so peak memory does not depend on message
+    length. Pass num_chars (the glyph count) when fp is not seekable. The
+    layout metadata, whose checksum is only known at the end, follows the
+    image data. codebook, a Codebook, replaces the built-in DOT_PATTERNS.
+    Returns the glyph count.
+    """
+    if isinstance(fp, (str, os.PathLike)):
+        # Nothing is left at the path if encoding fails, e.g. on an empty message
+        return _write_replacing(fp, lambda f: encrypt_stream(
+            source, f, num_chars, chars_per_row, band_rows, compress_level, stats, codebook))
+
+    stats = stats or NULL_STATS
+
+    grid_w, grid_h = grid_pixel_size()
+    image_width = chars_per_row * (grid_w + CHAR_SPACING) - CHAR_SPACING
+    height = image_size(num_chars, chars_per_row)[1] if num_chars is not None else None
+    writer = PNGStreamWriter(fp, image_width, height, compress_level)
+    stack = glyph_stack() if codebook is None else codebook.stack()
+
+    band_chars = chars_per_row * band_rows
+    buffered = np.empty(0, dtype=np.intp)
+    spacing = None  # the previous band's trailing ROW_SPACING rows, held until more glyphs follow
+    total = 0
+    crc = 0
+
+    def emit(indices):
+        nonlocal spacing
+        with stats.stage("render"):
+            rows = render_rows(indices, chars_per_row, image_width, stack=stack)
+        with stats.stage("compress"):
+            if spacing is not None:
+                writer.write_rows(spacing)
+            writer.write_rows(rows[:-ROW_SPACING] if ROW_SPACING else rows)
+        spacing = rows[len(rows) - ROW_SPACING:]
+
+    for chunk in iter_text(source):
+        indices, unknown = encode_glyphs(chunk, codebook)
+        total += len(indices)
+        crc = glyph_crc(chunk, codebook, crc)
+        stats.add("unknown_chars", unknown)
+        buffered = np.concatenate([buffered, indices])
+        full = len(buffered) // band_chars * band_chars
+        for start in range(0, full, band_chars):
+            emit(buffered[start:start + band_chars])
+        buffered = buffered[full:]
+
+    if len(buffered):
+        emit(buffered)
+    if total == 0:
+        raise ValueError("Cannot encode an empty message")
+    with stats.stage("compress"):
+        version = CODEBOOK_VERSION if codebook is None else codebook.version
+        writer.close({LAYOUT_TEXT_KEY: layout_text(make_layout(total, crc, chars_per_row, codebook=version))})
+    stats.add("chars_encoded", total)
+    return total
+
+# ---- Streaming PNG reader ----
+# (mode, bytes per pixel) for the 8-bit PNG colour types read strip by strip
+PNG_STRIP_MODES = {0: ("L", 1), 2: ("RGB", 3), 3: ("P", 1), 4: ("LA", 2), 6: ("RGBA", 4)}
+
+def _png_chunks(fp):
+    """
+    Yield (tag, data) for every chunk of a PNG after the signature. IDAT
+    payloads are yielded in pieces of at most STREAM_READ_SIZE bytes.
+    """
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            raise ValueError("Truncated PNG file")
+        length, tag = struct.unpack(">I4s", header)
+        if tag == b"IDAT":
+            while length:
+                piece = fp.read(min(length, STREAM_READ_SIZE))
+                if not piece:
+                    raise ValueError("Truncated PNG file")
+                length -= len(piece)
+                yield tag, piece
+        else:
+            yield tag, fp.read(length)
+        fp.read(4)  # CRC
+        if tag == b"IEND":
+            return
+
+class _ScanlineReader:
+    """
+    Inflate IDAT data on demand, never holding more than the requested
+    scanlines. consumed counts the payload bytes the inflater has taken in;
+    with a hasher they are also hashed, so the state can be checkpointed.
+    """
+
+    def __init__(self, chunks, stride, inflater=None, hasher=None, consumed=0):
+        self._chunks = chunks
+        self._stride = stride
+        self.inflater = inflater or zlib.decompressobj()
+        self.hasher = hasher
+        self.consumed = consumed
+        self._input = b""
+
+    def read(self, rows):
+        wanted = rows * self._stride
+        out = bytearray()
+        while len(out) < wanted:
+            if not self._input:
+                tag, data = next(self._chunks, (b"IEND", b""))
+                if tag == b"IEND":
+                    break
+                if tag != b"IDAT":
+                    continue
+                self._input = data
+            out += self.inflater.decompress(self._input, wanted - len(out))
+            tail = self.inflater.unconsumed_tail
+            used = len(self._input) - len(tail)
+            if self.hasher is not None:
+                self.hasher.update(self._input[:used])
+            self.consumed += used
+            self._input = tail
+        return bytes(out[:len(out) - len(out) % self._stride])
+
+def iter_image_strips(path, strip_height):
+    """
+    Yield consecutive (rows, width, 3) RGB arrays of at most strip_height rows.
+    8-bit non-interlaced PNGs are inflated and unfiltered one strip at a time;
+    anything else falls back to loading the whole image with Pillow.
+    """
+    with open(path, "rb") as fp:
+        if fp.read(8) == PNG_SIGNATURE:
+            chunks = _png_chunks(fp)
+            tag, ihdr = next(chunks)
+            width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+            if tag == b"IHDR" and depth == 8 and not interlace and color_type in PNG_STRIP_MODES:
+                yield from _iter_png_strips(chunks, width, height, color_type, strip_height)
+                return
+
+    img = Image.open(path).convert("RGB")
+    for y in range(0, img.height, strip_height):
+        yield np.asarray(img.crop((0, y, img.width, min(y + strip_height, img.height))))
+
+def _iter_png_strips(chunks, width, height, color_type, strip_height):
+    stride = width * PNG_STRIP_MODES[color_type][1] + 1
+    palette, chunks = _read_to_idat(chunks)
+    reader = _ScanlineReader(chunks, stride)
+    previous = None  # last unfiltered scanline of the previous strip
+    for y in range(0, height, strip_height):
+        rows = min(strip_height, height - y)
+        data = reader.read(rows)
+        if len(data) != rows * stride:
+            raise ValueError("Truncated PNG image data")
+        arr, previous = _unfilter_strip(data, previous, width, color_type, palette)
+        yield arr
+
+def _read_to_idat(chunks):
+    """Read ahead to the first IDAT, picking up the palette on the way; returns (palette or None, chunks)."""
+    palette = None
+    for tag, data in chunks:
+        if tag == b"PLTE":
+            palette = data
+        elif tag == b"IDAT":
+            return palette, _prepend((tag, data), chunks)
+    return palette, chunks
+
+def _unfilter_strip(data, previous, width, color_type, palette):
+    """
+    Unfilter whole scanlines of raw IDAT data into an RGB array. previous is
+    the last unfiltered scanline before them (None at the top); returns
+    (array, last unfiltered scanline of this strip).
+    """
+    mode, bpp = PNG_STRIP_MODES[color_type]
+    stride = width * bpp + 1
+    rows = len(data) // stride
+    # Pillow's zip decoder does the unfiltering; the previous scanline goes
+    # first, unfiltered, so Up/Average/Paeth rows see the right neighbour.
+    if previous is not None:
+        data = b"\x00" + previous + data
+    strip = Image.frombytes(
+        mode, (width, len(data) // stride), zlib.compress(data, 0), "zip", mode
+    )
+    if palette is not None and mode == "P":
+        strip.putpalette(palette)
+    previous = strip.crop((0, strip.height - 1, width, strip.height)).tobytes()
+    arr = np.asarray(strip.convert("RGB"))
+    return (arr[1:] if len(arr) > rows else arr), previous
+
+def _prepend(item, iterator):
+    yield item
+    yield from iterator
+
+def png_text(path):
+    """
+    Return the tEXt entries of a PNG, before and after the image data ({} for
+    other files). IDAT chunks are seeked over, so no pixels are read.
+    """
+    text = {}
+    with open(path, "rb") as fp:
+        if fp.read(8) != PNG_SIGNATURE:
+            return text
+        while True:
+            header = fp.read(8)
+            if len(header) < 8:
+                return text
+            length, tag = struct.unpack(">I4s", header)
+            if tag == b"tEXt":
+                key, _, value = fp.read(length).partition(b"\0")
+                text[key.decode("latin-1")] = value.decode("latin-1")
+            else:
+                fp.seek(length, 1)
+            fp.seek(4, 1)  # CRC
+            if tag == b"IEND":
+                return text
+
+def image_dimensions(path):
+    """Return (width, height) without decoding pixels, read straight from IHDR for PNGs."""
+    with open(path, "rb") as fp:
+        if fp.read(8) == PNG_SIGNATURE:
+            length, tag = struct.unpack(">I4s", fp.read(8))
+            if tag == b"IHDR":
+                return struct.unpack(">II", fp.read(8))
+    with Image.open(path) as img:
+        return img.size
+
+def _decrypt_python(img, progress=None, stats=NULL_STATS, geometry=None, limit=None, codebook=None):
+    """
+    Reference decoder: sample every dot with getpixel and match it in pure
+    Python. geometry, a GridGeometry, replaces the default grid; limit stops
+    after that many glyphs; codebook, an extended Codebook, replaces the
+    built-in patterns.
+    """
+    code_to_char = CODE_TO_CHAR if codebook is None else {
+        pattern_code(row): char for row, char in zip(codebook.cells.tolist(), codebook.chars)
+    }
+    W, H = img.size
+    grid_w, grid_h = grid_pixel_size()
+
+    # how many chars fit per row/column
+    cols, rows = grid_shape(W, H)
+    if geometry is not None:
+        cols, rows = geometry.cols, geometry.rows
+        geometry.check_bounds(W, H)
+
+    result = []
+    for ry in range(rows):
+        for cx in range(cols):
+            x = cx * (grid_w + CHAR_SPACING)
+            y = ry * (grid_h + ROW_SPACING)
+            if len(result) == limit:
+                continue
+            if geometry is not None:
+                extracted_pattern = tuple(
+                    find_closest_color(img.getpixel(centre), BG_COLOR) for centre in geometry.dot_centres(ry, cx)
+                )
+            elif x + grid_w > W or y + grid_h > H:
+                continue
+            else:
+                extracted_pattern = extract_dot_grid(img, x, y)
+            indices = [COLOR_INDEX[color] for color in extracted_pattern]
+            
+            # First try direct match on the packed code (for speed)
+            char = code_to_char.get(pattern_code(indices))
+            
+            stats.add("cells")
+            stats.add("exact_hits" if char is not None else "fuzzy_fallbacks")
+            
+            # If no direct match, score the cell against the codebook tables
+            if char is None:
+                char = nearest_chars([indices])[0] if codebook is None else \
+                    codebook.chars[codebook.nearest([indices])[0]]
+            
+            result.append(char if char is not None else '?')
+
+        if progress is not None:
+            progress(ry + 1, rows)
+
+    # join and lowercase
+    text = "".join(result)
+    return text.lower() if codebook is None else text
+
+# ---- Grid geometry ----
+# Runs of mask pixels shorter than this fraction of the median run are noise
+DETECT_MIN_RUN = 0.5
+# Centres fitted first when measuring the glyph pitch; the fit then widens fourfold per pass
+DETECT_HEAD = 64
+# Glyphs a span between two sampled dots is assumed to cross at most when deriving pitches
+DETECT_MAX_GLYPHS = 8
+DETECT_BAND_ROWS = 1024
+
+class GridGeometry:
+    """
+    Where an image's dots are: the centre of the first glyph's first dot
+    (x0, y0), the glyph pitch and dot pitch along each axis, and the number of
+    glyph columns and rows. Pitches may be fractional for rescaled images;
+    samples are taken at the nearest pixel.
+    """
+
+    def __init__(self, x0, y0, pitch_x, pitch_y, dot_pitch_x, dot_pitch_y, cols, rows):
+        self.x0, self.y0 = x0, y0
+        self.pitch_x, self.pitch_y = pitch_x, pitch_y
+        self.dot_pitch_x, self.dot_pitch_y = dot_pitch_x, dot_pitch_y
+        self.cols, self.rows = cols, rows
+
+    @classmethod
+    def from_spacing(cls, width, height, dot_size=DOT_SIZE, grid_spacing=GRID_SPACING,
+                     char_spacing=CHAR_SPACING, row_spacing=ROW_SPACING):
+        """The grid the encoder draws with these sizes, anchored at (0, 0), over a width x height image."""
+        dot_pitch = dot_size + grid_spacing
+        pitch_x = GRID_WIDTH * dot_pitch - grid_spacing + char_spacing
+        pitch_y = GRID_HEIGHT * dot_pitch - grid_spacing + row_spacing
+        return cls(dot_size // 2, dot_size // 2, pitch_x, pitch_y, dot_pitch, dot_pitch,
+                   (width + char_spacing) // pitch_x, (height + row_spacing) // pitch_y)
+
+    def __repr__(self):
+        return (f"GridGeometry(x0={self.x0:g}, y0={self.y0:g}, pitch=({self.pitch_x:g}, {self.pitch_y:g}), "
+                f"dot_pitch=({self.dot_pitch_x:g}, {self.dot_pitch_y:g}), cols={self.cols}, rows={self.rows})")
+
+    def dot_centres(self, row, col):
+        """The (x, y) pixel of every dot of one glyph, in pattern order."""
+        return [
+            (round(self.x0 + col * self.pitch_x + dx * self.dot_pitch_x),
+             round(self.y0 + row * self.pitch_y + dy * self.dot_pitch_y))
+            for dy in range(GRID_HEIGHT) for dx in range(GRID_WIDTH)
+        ]
+
+    def check_bounds(self, width, height, row_stop=None, cols=None):
+        """Raise ValueError unless every dot of glyph rows [0, row_stop) and columns [0, cols) is inside the image."""
+        row_stop = self.rows if row_stop is None else row_stop
+        cols = self.cols if cols is None else cols
+        if row_stop <= 0 or cols <= 0:
+            return
+        last_x, last_y = self.dot_centres(row_stop - 1, cols - 1)[-1]
+        first_x, first_y = self.dot_centres(0, 0)[0]
+        if min(first_x, first_y) < 0 or last_x >= width or last_y >= height:
+            raise ValueError(f"{self!r} reaches past the {width}x{height} px image")
+
+    def sample(self, arr, row_start, rows, cols):
+        """Gather the dot-centre pixels of glyph rows [row_start, row_start + rows) as (rows, cols, 9, 3)."""
+        self.check_bounds(arr.shape[1], arr.shape[0], row_start + rows, cols)
+        dy = np.repeat(np.arange(GRID_HEIGHT), GRID_WIDTH)
+        dx = np.tile(np.arange(GRID_WIDTH), GRID_HEIGHT)
+        ys = np.rint(
+            self.y0 + (row_start + np.arange(rows))[:, None, None] * self.pitch_y + dy * self.dot_pitch_y
+        ).astype(np.intp)
+        xs = np.rint(self.x0 + np.arange(cols)[None, :, None] * self.pitch_x + dx * self.dot_pitch_x).astype(np.intp)
+        return arr[ys, xs]
+
+def fits_default_grid(width, height):
+    """Whether an image of this size is exactly what the encoder draws for some number of glyphs."""
+    grid_w, grid_h = grid_pixel_size()
+    return (width + CHAR_SPACING) % (grid_w + CHAR_SPACING) == 0 and \
+        (height + ROW_SPACING) % (grid_h + ROW_SPACING) == 0
+
+def detect_grid(source):
+    """
+    Measure the grid of a dot image that may have been rescaled, padded or
+    cropped. One banded pass over the pixels builds row and column profiles
+    of the pixels that differ from BG_COLOR; along each axis the runs in the
+    profile are the dot rows/columns, whose spacing gives the dot pitch, and
+    fitting their centres to glyphs of GRID_WIDTH/GRID_HEIGHT dots gives the
+    glyph pitch and origin. Returns a GridGeometry; ValueError if no grid of
+    dots is found.
+    """
+    return _fit_grid(*dot_profiles(source))
+
+def _fit_grid(column_profile, row_profile):
+    x0, pitch_x, dot_pitch_x, cols = _fit_axis(_profile_runs(column_profile), len(column_profile), GRID_WIDTH)
+    y0, pitch_y, dot_pitch_y, rows = _fit_axis(_profile_runs(row_profile), len(row_profile), GRID_HEIGHT)
+    return GridGeometry(x0, y0, pitch_x, pitch_y, dot_pitch_x, dot_pitch_y, cols, rows)
+
+def dot_profiles(source):
+    """(column profile, row profile): how many dot pixels (see dot_mask_lut) each column and row holds."""
+    if not isinstance(source, np.ndarray) and source.mode != "RGB":
+        source = source.convert("RGB")
+    arr = np.asarray(source)
+    height, width = arr.shape[:2]
+    lut = dot_mask_lut()
+    column_profile = np.zeros(width, dtype=np.int64)
+    row_profile = np.empty(height, dtype=np.int64)
+    for y in range(0, height, DETECT_BAND_ROWS):
+        mask = lut.take(rgb_keys(arr[y:y + DETECT_BAND_ROWS, :, :3]))
+        column_profile += mask.sum(axis=0)
+        row_profile[y:y + len(mask)] = mask.sum(axis=1)
+    return column_profile, row_profile
+
+def anchored_grid_fits(profiles, dot_size=DOT_SIZE, grid_spacing=GRID_SPACING, char_spacing=CHAR_SPACING,
+                       row_spacing=ROW_SPACING):
+    """
+    Whether the grid the encoder draws with these sizes, anchored at the
+    top-left corner, explains every dot pixel in the (column, row) profiles:
+    no dots in the spacing between glyphs or in padding past the last glyph.
+    True for encoder output with background padded on the right or bottom;
+    False once the image has been rescaled or cropped on the left or top.
+    """
+    dot_pitch = dot_size + grid_spacing
+    for profile, dots, spacing in ((profiles[0], GRID_WIDTH, char_spacing), (profiles[1], GRID_HEIGHT, row_spacing)):
+        # Dots are drawn with inclusive ellipse bounds, so a glyph covers span + 1 pixels
+        span = dots * dot_pitch - grid_spacing
+        pitch = span + spacing
+        glyphs = (len(profile) + spacing) // pitch
+        if glyphs <= 0:
+            return False
+        offsets = np.arange(len(profile)) % pitch
+        outside = (offsets > span) | (np.arange(len(profile)) >= glyphs * pitch)
+        if profile[outside].any():
+            return False
+    return True
+
+_dot_mask_lut = None
+
+def dot_mask_lut():
+    """
+    (2**24,) bool table, True for colours at least half way from BG_COLOR to
+    the nearest palette colour. Stricter than the classifier's background
+    test, so noise in the background does not read as dots. Built in memory.
+    """
+    global _dot_mask_lut
+    if _dot_mask_lut is None:
+        threshold = min(color_distance(color, BG_COLOR) for color in COLORS) / 2
+        channel = np.arange(256, dtype=np.int32)
+        red = (channel - BG_COLOR[0]) ** 2
+        green_blue = (((channel - BG_COLOR[1]) ** 2)[:, None] + ((channel - BG_COLOR[2]) ** 2)[None, :]).reshape(-1)
+        lut = np.empty((256, 1 << 16), dtype=bool)
+        for r in range(256):
+            np.greater_equal(red[r] + green_blue, threshold * threshold, out=lut[r])
+        _dot_mask_lut = lut.reshape(-1)
+    return _dot_mask_lut
+
+def _profile_runs(profile):
+    """Centres of the runs where profile stands out from its noise floor, dropping runs cut short."""
+    floor, peak = np.percentile(profile, 10), profile.max()
+    on = np.concatenate([[0], (profile > floor + 0.1 * (peak - floor)).astype(np.int8), [0]])
+    edges = np.diff(on)
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = stops - starts
+    if not len(lengths):
+        raise ValueError("No dots found in the image")
+    typical = np.median(lengths)
+    # Noise makes short runs; a crop through a dot shortens the run at the border
+    border = (starts == 0) | (stops == len(profile))
+    keep = lengths >= np.where(border, 0.9, DETECT_MIN_RUN) * typical
+    return (starts[keep] + stops[keep] - 1) / 2
+
+def _fit_axis(centres, size, dots):
+    """
+    Fit dot centres along one axis to glyphs made of `dots` evenly spaced dots.
+    Returns (first dot centre, glyph pitch, dot pitch, glyph count).
+    """
+    if len(centres) < 2:
+        raise ValueError("Too few dots to measure the grid")
+    gaps = np.diff(centres)
+    # The commonest short gap is between neighbouring dots of one glyph
+    dot_pitch = float(np.median(gaps[gaps <= 1.25 * np.percentile(gaps, 10)]))
+    tol = max(1.0, 0.2 * dot_pitch)
+    head = centres[:DETECT_HEAD]
+    glyph_span = (dots - 1) * dot_pitch
+
+    if head[-1] - head[0] <= glyph_span + tol:
+        # A single glyph: take the pitch the encoder would use at this scale
+        pitch = dot_pitch * (grid_pixel_size()[0] + CHAR_SPACING) / (DOT_SIZE + GRID_SPACING)
+        origins = np.array([head[0] - k * dot_pitch for k in range(dots)])
+    else:
+        # Candidate pitches: spans from the first glyph's dots to later dots, corrected by up to a
+        # glyph's worth of dot slots and divided by the glyphs they may cross; long spans give
+        # sub-pixel pitches for rescaled images
+        spans = (head[None, :] - head[:dots + 1, None]).ravel()
+        spans = spans[spans > 0]
+        candidates = (
+            (spans[:, None, None] - np.arange(-(dots - 1), dots)[None, :, None] * dot_pitch)
+            / np.arange(1, DETECT_MAX_GLYPHS + 1)
+        ).ravel()
+        candidates = candidates[(candidates >= dots * dot_pitch - tol) & (candidates <= 4 * dots * dot_pitch)]
+        candidates = np.unique(np.round(candidates * 16) / 16)
+        origins = head[0] - np.arange(dots) * dot_pitch
+        inliers = _axis_assign(head, origins[None, :, None], candidates[:, None, None], dot_pitch, dots, tol)[2]
+        ratio = inliers.mean(axis=-1)
+        fits = ratio >= ratio.max() - 0.02
+        # Any multiple of the dot pitch below the true glyph pitch also fits; the largest one is the glyph
+        best = np.flatnonzero(fits.any(axis=1))[-1]
+        pitch = float(candidates[best])
+        origins = origins[fits[best]]
+
+    # Of the phases that fit, keep the one whose grid starts nearest the image edge
+    starts = [origin - pitch * np.floor((origin + tol) / pitch) for origin in origins]
+    origin = float(min(starts))
+
+    # Refine on a widening prefix so small pitch errors cannot accumulate along the axis
+    count = len(head)
+    while True:
+        g, k, ok = _axis_assign(centres[:count], origin, pitch, dot_pitch, dots, tol)
+        if ok.sum() >= 3 and len(np.unique(g[ok])) > 1:
+            design = np.stack([np.ones(ok.sum()), g[ok], k[ok]], axis=1)
+            (origin, pitch, dot_pitch), *_ = np.linalg.lstsq(design, centres[:count][ok], rcond=None)
+        if count >= len(centres):
+            break
+        count *= 4
+    origin = origin - pitch * np.floor((origin + tol) / pitch)
+    glyphs = int(np.floor((size - 1 + tol - origin - glyph_span) / pitch)) + 1
+    return float(origin), float(pitch), float(dot_pitch), max(glyphs, 0)
+
+def _axis_assign(centres, origin, pitch, dot_pitch, dots, tol):
+    """(glyph index, dot slot, inlier mask) of every centre under one axis fit."""
+    rel = centres - origin
+    g = np.floor((rel + tol) / pitch)
+    r = rel - g * pitch
+    k = np.rint(r / dot_pitch)
+    ok = (np.abs(r - k * dot_pitch) <= tol) & (k >= 0) & (k < dots)
+    return g, k, ok
+
+def layout_geometry(layout, width, height):
+    """
+    The GridGeometry the layout metadata describes if the image is still the
+    size it was encoded at, else None (it was rescaled or cropped).
+    """
+    geometry = GridGeometry.from_spacing(
+        width, height, layout["dot_size"], layout["grid_spacing"], layout["char_spacing"], layout["row_spacing"]
+    )
+    cols = layout["chars_per_row"]
+    rows = max(1, (layout["chars"] + cols - 1) // cols)
+    if (width, height) != (cols * geometry.pitch_x - layout["char_spacing"],
+                           rows * geometry.pitch_y - layout["row_spacing"]):
+        return None
+    return geometry
+
+def on_default_grid(layout, width, height):
+    """Whether an image of this size and layout metadata (or None) is sampled on the default grid."""
+    if layout is None:
+        return fits_default_grid(width, height)
+    spacing = (layout["dot_size"], layout["grid_spacing"], layout["char_spacing"], layout["row_spacing"])
+    return spacing == (DOT_SIZE, GRID_SPACING, CHAR_SPACING, ROW_SPACING) and \
+        layout_geometry(layout, width, height) is not None
+
+def grid_geometry(source, layout=None, stats=NULL_STATS):
+    """
+    Choose how to sample source (a PIL image or array): returns
+    (GridGeometry or None for the default grid, number of glyphs or None).
+    The layout metadata's geometry is used while the image has the size it
+    describes, the default grid when the size fits it, the encoder's grid
+    anchored at the top-left corner when only background padding has been
+    added, and detect_grid() otherwise; layout metadata always limits the
+    glyph count.
+    """
+    width, height = (source.shape[1], source.shape[0]) if isinstance(source, np.ndarray) else source.size
+    geometry = None
+    if layout is not None:
+        geometry = layout_geometry(layout, width, height)
+    elif fits_default_grid(width, height):
+        return None, None
+    if geometry is None:
+        with stats.stage("detect"):
+            profiles = dot_profiles(source)
+            # Background padding on the right or bottom leaves the encoder's grid in place
+            spacing = () if layout is None else (
+                layout["dot_size"], layout["grid_spacing"], layout["char_spacing"], layout["row_spacing"])
+            if anchored_grid_fits(profiles, *spacing):
+                if layout is None:
+                    return None, None
+                geometry = GridGeometry.from_spacing(width, height, *spacing)
+            else:
+                geometry = _fit_grid(*profiles)
+    if layout is None:
+        return geometry, None
+    cols, chars = layout["chars_per_row"], layout["chars"]
+    rows = (chars + cols - 1) // cols
+    if geometry.cols < cols or geometry.rows < rows:
+        raise ValueError(f"Image of {width}x{height} px cannot hold the {chars} characters its layout describes")
+    geometry.cols, geometry.rows = cols, rows
+    return geometry, chars
+
+# ---- Vectorized decoding ----
+# Offsets of every dot centre from the top-left corner of its grid, in pattern order
+DOT_CENTER_DY = tuple(
+    ry * (DOT_SIZE + GRID_SPACING) + DOT_SIZE // 2
+    for ry in range(GRID_HEIGHT) for rx in range(GRID_WIDTH)
+)
+DOT_CENTER_DX = tuple(
+    rx * (DOT_SIZE + GRID_SPACING) + DOT_SIZE // 2
+    for ry in range(GRID_HEIGHT) for rx in range(GRID_WIDTH)
+)
+
+# Classifications of at least this many samples go through the 24-bit lookup table
+LUT_MIN_SAMPLES = 1 << 16
+# Directory for derived tables; DOT_CODEC_CACHE_DIR overrides it
+CACHE_DIR = os.environ.get("DOT_CODEC_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "dot_codec"
+)
+
+_palette_lut = None
+
+def palette_lut_path():
+    """Cache file for the lookup table, named after the palette and threshold it encodes."""
+    key = zlib.crc32(repr((COLORS, BG_COLOR, 30, EMPTY)).encode("ascii"))
+    return os.path.join(CACHE_DIR, f"palette_lut-{key:08x}.npy")
+
+def palette_lut():
+    """
+    Return a (2**24,) uint8 table mapping (r << 16) | (g << 8) | b to the
+    index classify_pixels would give that colour. Built on first use from the
+    distance rules themselves (a fraction of a second) and cached on disk; an
+    unreadable or unwritable cache only costs the rebuild.
+    """
+    global _palette_lut
+    if _palette_lut is not None:
+        return _palette_lut
+    path = palette_lut_path()
+    try:
+        lut = np.load(path, mmap_mode="r")
+        if lut.shape != (1 << 24,) or lut.dtype != np.uint8:
+            raise ValueError(f"Bad palette table in {path}")
+    except (OSError, ValueError):
+        lut = _build_palette_lut()
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, lut)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    _palette_lut = lut
+    return lut
+
+def _build_palette_lut(planes=16):
+    """
+    Evaluate the _classify_direct rules for every 24-bit colour, a few red
+    planes at a time. Squared distances are separable, so each is a red term
+    plus a precomputed green/blue plane; the strict < keeps the first minimum.
+    """
+    lut = np.empty(1 << 24, dtype=np.uint8)
+    channel = np.arange(256, dtype=np.int32)
+
+    def plane_terms(color):
+        red = (channel - color[0]) ** 2
+        green_blue = ((channel - color[1]) ** 2)[:, None] + ((channel - color[2]) ** 2)[None, :]
+        return red, green_blue.reshape(-1)
+
+    terms = [plane_terms(color) for color in COLORS]
+    bg_red, bg_green_blue = plane_terms(BG_COLOR)
+    for r in range(0, 256, planes):
+        rows = slice(r, r + planes)
+        best = terms[0][0][rows, None] + terms[0][1]
+        index = np.zeros(best.shape, dtype=np.uint8)
+        for k, (red, green_blue) in enumerate(terms[1:], 1):
+            dist = red[rows, None] + green_blue
+            closer = dist < best
+            np.copyto(best, dist, where=closer)
+            index[closer] = k
+        index[bg_red[rows, None] + bg_green_blue < 30 * 30] = EMPTY
+        lut[r << 16:(r + planes) << 16] = index.reshape(-1)
+    return lut
+
+def classify_pixels(pixels):
+    """
+    Vectorized find_closest_color: map an (..., 3) array of RGB samples to
+    indices into COLORS, or EMPTY where the sample is close to BG_COLOR.
+    Large inputs are classified with one palette_lut() take; small ones, where
+    loading the table would dominate, are computed directly.
+    """
+    if pixels.size < 3 * LUT_MIN_SAMPLES:
+        return _classify_direct(pixels)
+    return palette_lut().take(rgb_keys(pixels)).astype(np.intp)
+
+def rgb_keys(pixels):
+    """(r << 16) | (g << 8) | b of an (..., 3) uint8 array, the index into the 24-bit tables."""
+    pixels = pixels.astype(np.uint32)
+    return (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+
+def _classify_direct(pixels):
+    """Squared integer distances give exactly the same decisions as the sqrt rules."""
+    pixels = pixels.astype(np.int32)
+    bg_dist = ((pixels - np.array(BG_COLOR, dtype=np.int32)) ** 2).sum(axis=-1)
+    dists = ((pixels[..., None, :] - np.array(COLORS, dtype=np.int32)) ** 2).sum(axis=-1)
+    # argmin keeps the first minimum, like the strict < in find_closest_color
+    indices = dists.argmin(axis=-1)
+    indices[bg_dist < 30 * 30] = EMPTY
+    return indices
+
+def sample_cells(arr, rows, cols):
+    """Gather the nine dot-centre pixels of every cell in one fancy-indexing pass."""
+    grid_w, grid_h = grid_pixel_size()
+    ys = np.arange(rows)[:, None, None] * (grid_h + ROW_SPACING) + DOT_CENTER_DY
+    xs = np.arange(cols)[None, :, None] * (grid_w + CHAR_SPACING) + DOT_CENTER_DX
+    return arr[ys, xs]
+
+def _decrypt_numpy(img, progress=None, stats=NULL_STATS, geometry=None, limit=None, codebook=None):
+    """
+    Vectorized decoder: one array conversion, then one gather and one
+    classification for the whole image, or per band when reporting progress.
+    img may be an RGB PIL Image or an (H, W, 3) uint8 array. geometry, a
+    GridGeometry, replaces the default grid; limit stops after that many
+    glyphs; codebook, an extended Codebook, replaces the built-in patterns.
+    """
+    with stats.stage("convert"):
+        arr = np.asarray(img)
+    cols, rows = grid_shape(arr.shape[1], arr.shape[0])
+    if geometry is not None:
+        cols, rows = geometry.cols, geometry.rows
+    if rows <= 0 or cols <= 0:
+        return ""
+
+    grid_w, grid_h = grid_pixel_size()
+    band_rows = rows if progress is None else PROGRESS_BAND_ROWS
+    result = []
+    for row in range(0, rows, band_rows):
+        stop = min(row + band_rows, rows)
+        band_limit = None if limit is None else limit - row * cols
+        if geometry is None:
+            band = arr[row * (grid_h + ROW_SPACING):]
+            result.append(_decode_cells(band, stop - row, cols, stats, band_limit, codebook=codebook))
+        else:
+            result.append(_decode_cells(arr, stop - row, cols, stats, band_limit, geometry, row, codebook))
+        if progress is not None:
+            progress(stop, rows)
+    return "".join(result)
+
+def _decode_cells(arr, rows, cols, stats, limit=None, geometry=None, row_start=0, codebook=None):
+    """
+    Sample, classify and match the top rows x cols glyphs of arr, or only the
+    first limit of them, timing each stage, and return their glyph text. With
+    a GridGeometry the glyph rows from row_start on are sampled where it
+    places them instead.
+    """
+    cells = _classify_cells(arr, rows, cols, stats, limit, geometry, row_start)
+    with stats.stage("match"):
+        return cells_text(cells, stats, codebook)
+
+def _classify_cells(arr, rows, cols, stats, limit=None, geometry=None, row_start=0):
+    """The (n, 9) palette indices of the glyphs _decode_cells would match."""
+    with stats.stage("sample"):
+        samples = sample_cells(arr, rows, cols) if geometry is None else geometry.sample(arr, row_start, rows, cols)
+        samples = samples.reshape(-1, DOTS_PER_CHAR, 3)[:limit]
+    with stats.stage("classify"):
+        return classify_pixels(samples).reshape(-1, DOTS_PER_CHAR)
+
+DECODE_BACKENDS = {
+    "python": _decrypt_python,
+    "numpy": _decrypt_numpy,
+}
+
+def normalize_message(message):
+    """Return the text a clean decode of message yields: lowercase, unsupported characters as spaces."""
+    return "".join(char if char in DOT_PATTERNS else " " for char in message.upper()).lower()
+
+def decode_image(source, backend="numpy", progress=None, stats=None, cache=None, layout=None, geometry=None):
+    """
+    Decode a dot image held in memory: a PIL Image, an (H, W, 3) or (H, W, 4)
+    uint8 array, or the bytes of an encoded image file. No disk I/O. Compact
+    images are recognised by their marker and read via decode_compact.
+    stats, a CodecStats, collects per-stage timings and match counters; with a
+    DecodeCache, pixels decoded before return the stored text.
+
+    With layout metadata (from the image's text chunks, or passed for arrays)
+    exactly the recorded characters are decoded and checked against the
+    checksum, raising ChecksumError on a mismatch. Images whose size matches
+    neither the metadata nor the default grid (rescaled, padded or cropped)
+    are sampled where detect_grid() finds the dots; pass geometry, a
+    GridGeometry, to override. Images whose layout names an extended codebook
+    are matched against it (see load_codebook).
+    """
+    if backend not in DECODE_BACKENDS:
+        raise ValueError(f"Unknown decode backend: {backend}")
+
+    stats = stats or NULL_STATS
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with stats.stage("load"):
+            source = Image.open(io.BytesIO(source))
+            source.load()
+    if not isinstance(source, np.ndarray):
+        # Text chunks after the image data only reach info once it is loaded
+        source.load()
+        if layout is None:
+            layout = image_layout(source)
+        if compact_block_size(source):
+            return decode_compact(source, stats=stats, layout=layout)
+    if isinstance(source, np.ndarray):
+        if source.dtype != np.uint8 or source.ndim != 3 or source.shape[2] not in (3, 4):
+            raise ValueError(f"Expected an (H, W, 3) uint8 array, got {source.shape} {source.dtype}")
+        source = source[..., :3]
+        if backend == "python":
+            source = Image.fromarray(np.ascontiguousarray(source))
+    elif source.mode != "RGB":
+        with stats.stage("convert"):
+            source = source.convert("RGB")
+    limit = None
+    if geometry is None:
+        geometry, limit = grid_geometry(source, layout, stats)
+    elif layout is not None:
+        limit = layout["chars"]
+    codebook = layout_codebook(layout)
+    if cache is None:
+        text = DECODE_BACKENDS[backend](source, progress, stats, geometry, limit, codebook)
+        if layout is not None:
+            check_layout(text, layout)
+        return unescape_text(text, codebook) + layout_tail(layout)
+
+    with stats.stage("convert"):
+        pixels = np.ascontiguousarray(source)
+    key = cache.key(pixels, layout, geometry)
+    text = cache.get(key)
+    if text is not None:
+        stats.add("cache_hits")
+        return text
+    stats.add("cache_misses")
+    text = DECODE_BACKENDS[backend](pixels if backend == "numpy" else source, progress, stats, geometry, limit,
+                                    codebook)
+    if layout is not None:
+        check_layout(text, layout)
+    text = unescape_text(text, codebook) + layout_tail(layout)
+    cache.put(key, text)
+    return text
+
+def decrypt_image(path="encrypted_message.png", backend="numpy", progress=None, stats=None, cache=None):
+    """
+    Decode the dot image at path using one of DECODE_BACKENDS.
+    progress(rows_done, rows_total) is called as glyph rows are decoded.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such file: {path}")
+    if is_raw_cells(path):
+        with RawCells(path) as raw:
+            return raw.decode(stats=stats)
+
+    with Image.open(path) as img:
+        if stats is not None:
+            with stats.stage("load"):
+                img.load()
+        return decode_image(img, backend, progress, stats, cache)
+
+def decrypt_image_iter(path="encrypted_message.png", band_rows=16, stats=None):
+    """
+    Decode the image at path band_rows glyph rows at a time, yielding each
+    character as soon as its strip is decoded. Peak memory stays near one strip.
+    With layout metadata, iteration stops after the recorded characters and
+    raises ChecksumError at the end if they do not match the checksum.
+    Images off the default grid (rescaled, cropped or drawn with other
+    spacings) need the whole image for detect_grid() and are decoded in one go.
+    Raw cell files are read through their memory map.
+    """
+    stats = stats or NULL_STATS
+    layout, _, blocks = image_cells(path, band_rows, stats)
+    texts = (chars for _, chars in match_cells(blocks, layout, stats))
+    codebook = layout_codebook(layout)
+    if codebook is not None:
+        texts = codebook.unescape_stream(texts)
+    for chars in texts:
+        yield from chars
+    yield from layout_tail(layout)
+
+def image_cells(path, band_rows=16, stats=NULL_STATS):
+    """
+    Open a dot image or raw cell file for reading glyph by glyph. Returns
+    (layout or None, chars_per_row, iterator of (n, 9) palette index arrays),
+    streaming band_rows glyph rows at a time where the format allows it.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such file: {path}")
+
+    if is_raw_cells(path):
+        raw = RawCells(path)
+        return raw.layout, raw.chars_per_row, raw.iter_blocks(band_rows * raw.chars_per_row)
+
+    text = png_text(path)
+    layout = parse_layout(text[LAYOUT_TEXT_KEY]) if LAYOUT_TEXT_KEY in text else None
+    if text.get(COMPACT_TEXT_KEY) is not None:
+        # Compact images are small enough to decode whole
+        with Image.open(path) as img:
+            cells = compact_cells(img, stats=stats, layout=layout)
+            cols = img.width // (GRID_WIDTH * compact_block_size(img))
+        return layout, cols, iter([cells])
+
+    width, height = image_dimensions(path)
+    if not on_default_grid(layout, width, height):
+        with Image.open(path) as img:
+            with stats.stage("load"):
+                img = img.convert("RGB")
+        geometry, limit = grid_geometry(img, layout, stats)
+        with stats.stage("convert"):
+            arr = np.asarray(img)
+        cells = _classify_cells(arr, geometry.rows, geometry.cols, stats, limit, geometry)
+        return layout, geometry.cols, iter([cells])
+
+    cols = layout["chars_per_row"] if layout is not None else grid_shape(width, height)[0]
+    return layout, cols, _iter_strip_cells(path, band_rows, cols, layout, stats)
+
+def _iter_strip_cells(path, band_rows, cols, layout, stats):
+    grid_w, grid_h = grid_pixel_size()
+    pitch_h = grid_h + ROW_SPACING
+    remaining = None if layout is None else layout["chars"]
+    strips = iter_image_strips(path, band_rows * pitch_h)
+    while remaining != 0:
+        with stats.stage("inflate"):
+            strip = next(strips, None)
+        if strip is None:
+            return
+        rows = grid_shape(strip.shape[1], len(strip))[1]
+        if rows <= 0 or cols <= 0:
+            continue
+        cells = _classify_cells(strip, rows, cols, stats, remaining)
+        if remaining is not None:
+            remaining -= len(cells)
+        yield cells
+
+def match_cells(blocks, layout=None, stats=NULL_STATS):
+    """
+    Yield (cells, glyph text) for each (n, 9) block of palette indices,
+    matched against the layout's codebook. With a layout, ChecksumError is
+    raised after the last block unless the text matches its character count
+    and checksum.
+    """
+    codebook = layout_codebook(layout)
+    count = 0
+    crc = 0
+    for cells in blocks:
+        with stats.stage("match"):
+            chars = cells_text(cells, stats, codebook)
+        count += len(chars)
+        crc = zlib.crc32(chars.encode("utf-8"), crc)
+        yield cells, chars
+    if layout is not None and (count != layout["chars"] or f"{crc:08x}" != layout["crc32"]):
+        raise ChecksumError(f"Decoded text does not match the image checksum {layout['crc32']}")
+
+# ---- Compact palette format ----
+# tEXt key marking a compact image; its value is the block size k
+COMPACT_TEXT_KEY = "dot-codec-compact"
+# Palette index i is codebook index i: COLORS in order, then BG_COLOR for EMPTY
+COMPACT_PALETTE = COLORS + [BG_COLOR]
+
+def compact_indices(message, chars_per_row=CHARS_PER_ROW, block=1, codebook=None):
+    """
+    Lay message out as an (rows * 3k, chars_per_row * 3k) uint8 array of
+    palette indices, one k x k block per dot and no spacing between glyphs.
+    """
+    glyphs = encode_glyphs(message, codebook)[0]
+    num_rows = (len(glyphs) + chars_per_row - 1) // chars_per_row
+    blank = BLANK_GLYPH if codebook is None else len(codebook)
+    indices = np.full(num_rows * chars_per_row, blank, dtype=np.intp)
+    indices[:len(glyphs)] = glyphs
+    cells = glyph_cells(indices, codebook).reshape(num_rows, chars_per_row, GRID_HEIGHT, GRID_WIDTH)
+    grid = cells.transpose(0, 2, 1, 3).reshape(num_rows * GRID_HEIGHT, chars_per_row * GRID_WIDTH)
+    if block > 1:
+        grid = grid.repeat(block, axis=0).repeat(block, axis=1)
+    return grid
+
+def compact_layout(message, chars_per_row, block, codebook=None):
+    """Layout metadata for a compact image: dots are block pixels with no spacing."""
+    if codebook is None:
+        return make_layout(len(message.upper()), text_crc(message), chars_per_row, block, 0, 0, 0)
+    glyphs = codebook.glyph_text(message)
+    return make_layout(len(glyphs), zlib.crc32(glyphs.encode("utf-8")), chars_per_row, block, 0, 0, 0,
+                       codebook.version)
+
+def render_compact(message, chars_per_row=CHARS_PER_ROW, block=1):
+    """Render message in the compact format as a "P" mode image; save it with save_compact."""
+    if not message:
+        raise ValueError("Cannot encode an empty message")
+    image = Image.fromarray(compact_indices(message, chars_per_row, block), "P")
+    image.putpalette([channel for color in COMPACT_PALETTE for channel in color])
+    image.info[COMPACT_TEXT_KEY] = str(block)
+    image.info[LAYOUT_TEXT_KEY] = layout_text(compact_layout(message, chars_per_row, block))
+    return image
+
+def write_compact_png(fp, indices, block, compress_level=9, layout=None):
+    """
+    Write palette indices as a 4-bit PNG with the compact palette, marker and
+    layout metadata when given. Scanlines are left unfiltered: the index
+    planes deflate better raw than with the adaptive filters Pillow picks.
+    """
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, "wb") as f:
+            return write_compact_png(f, indices, block, compress_level, layout)
+    height, width = indices.shape
+    if width % 2:
+        indices = np.pad(indices, ((0, 0), (0, 1)))
+    scanlines = np.zeros((height, 1 + indices.shape[1] // 2), dtype=np.uint8)  # filter byte 0
+    scanlines[:, 1:] = (indices[:, 0::2] << 4) | indices[:, 1::2]
+    data = zlib.compress(scanlines.tobytes(), compress_level)
+
+    fp.write(PNG_SIGNATURE)
+    fp.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 4, 3, 0, 0, 0)))
+    fp.write(png_chunk(b"PLTE", bytes(channel for color in COMPACT_PALETTE for channel in color)))
+    fp.write(png_chunk(b"tEXt", COMPACT_TEXT_KEY.encode("latin-1") + b"\0" + str(block).encode("ascii")))
+    if layout is not None:
+        fp.write(png_chunk(b"tEXt", LAYOUT_TEXT_KEY.encode("latin-1") + b"\0" + layout_text(layout).encode("ascii")))
+    for start in range(0, len(data), IDAT_CHUNK_SIZE):
+        fp.write(png_chunk(b"IDAT", data[start:start + IDAT_CHUNK_SIZE]))
+    fp.write(png_chunk(b"IEND", b""))
+
+def save_compact(image, fp):
+    """Write a render_compact image to fp (a path or binary file)."""
+    write_compact_png(fp, np.asarray(image), int(image.info[COMPACT_TEXT_KEY]), layout=image_layout(image))
+
+def encrypt_compact(message, fp, chars_per_row=CHARS_PER_ROW, block=1, codebook=None):
+    """
+    Encode message straight to a compact PNG at fp (a path or binary file).
+    Returns the glyph count, as encrypt_stream does and the layout records.
+    """
+    if not message:
+        raise ValueError("Cannot encode an empty message")
+    layout = compact_layout(message, chars_per_row, block, codebook)
+    write_compact_png(fp, compact_indices(message, chars_per_row, block, codebook), block, layout=layout)
+    return layout["chars"]
+
+def compact_block_size(img):
+    """The block size k recorded in a compact image, or None for the visual format."""
+    value = img.info.get(COMPACT_TEXT_KEY)
+    return int(value) if value is not None and img.mode == "P" else None
+
+def decode_compact(img, block=None, stats=None, layout=None):
+    """
+    Decode a compact image straight from its palette indices: the image's
+    palette is mapped onto COMPACT_PALETTE by exact colour, then one index per
+    block is looked up in the codebook. block and layout default to the ones
+    recorded in the image; with a layout only its characters are decoded and
+    the checksum is verified.
+    """
+    stats = stats or NULL_STATS
+    if layout is None:
+        layout = image_layout(img)
+    cells = compact_cells(img, block, stats, layout)
+    codebook = layout_codebook(layout)
+    with stats.stage("match"):
+        text = cells_text(cells, stats, codebook)
+    if layout is not None:
+        check_layout(text, layout)
+    return unescape_text(text, codebook) + layout_tail(layout)
+
+def compact_cells(img, block=None, stats=NULL_STATS, layout=None):
+    """The (n, 9) palette indices of a compact image's glyphs, limited to the layout's characters."""
+    block = block or compact_block_size(img)
+    if img.mode != "P" or not block:
+        raise ValueError("Not a compact dot image")
+    palette = img.getpalette() or []
+    entry_index = {tuple(color): i for i, color in enumerate(COMPACT_PALETTE)}
+    remap = np.full(256, 255, dtype=np.uint8)
+    for i in range(len(palette) // 3):
+        remap[i] = entry_index.get(tuple(palette[3 * i:3 * i + 3]), 255)
+
+    with stats.stage("convert"):
+        indices = np.asarray(img)
+    grid_h, grid_w = GRID_HEIGHT * block, GRID_WIDTH * block
+    rows, cols = indices.shape[0] // grid_h, indices.shape[1] // grid_w
+    limit = None
+    if layout is not None:
+        limit = layout["chars"]
+        if layout["chars_per_row"] != cols or limit > rows * cols:
+            raise ValueError("Compact image does not match its layout metadata")
+        rows = (limit + cols - 1) // cols
+    with stats.stage("sample"):
+        centres = indices[block // 2:rows * grid_h:block, block // 2:cols * grid_w:block]
+        cells = remap[centres]
+    if (cells == 255).any():
+        raise ValueError("Compact image uses colours outside the dot palette")
+    cells = cells.reshape(rows, GRID_HEIGHT, cols, GRID_WIDTH).transpose(0, 2, 1, 3).reshape(-1, DOTS_PER_CHAR)
+    return cells[:limit]
+
+# ---- Raw cell-index format ----
+# A raw cell file is RAW_HEADER followed by one row of DOTS_PER_CHAR uint8
+# palette indices per character (CODEBOOK order, EMPTY for no dot). Cells have
+# a fixed size, so characters [i, j) are bytes i * 9 to j * 9 after the header.
+RAW_MAGIC = b"DOTCELLS"
+RAW_VERSION = 1
+RAW_SUFFIX = ".cells"
+# magic, version, codebook version, dots per cell, chars per row, chars, crc32
+RAW_HEADER = struct.Struct("<8sHHIIQI")
+
+def is_raw_cells(path):
+    with open(path, "rb") as fp:
+        return fp.read(len(RAW_MAGIC)) == RAW_MAGIC
+
+def write_raw(fp, blocks, chars_per_row=CHARS_PER_ROW, codebook=CODEBOOK_VERSION):
+    """
+    Write a raw cell file to fp (a path or seekable binary file) from (cells,
+    text) blocks, text being the glyph text the cells decode to under codebook
+    (a version). The header is patched with the count and checksum at the end.
+    Returns the character count.
+    """
+    if isinstance(fp, (str, os.PathLike)):
+        return _write_replacing(fp, lambda f: write_raw(f, blocks, chars_per_row, codebook))
+    header_offset = fp.tell()
+    fp.write(bytes(RAW_HEADER.size))
+    total = 0
+    crc = 0
+    for cells, text in blocks:
+        fp.write(np.ascontiguousarray(cells, dtype=np.uint8).tobytes())
+        total += len(cells)
+        crc = zlib.crc32(text.encode("utf-8"), crc)
+    if total == 0:
+        raise ValueError("Cannot encode an empty message")
+    end = fp.tell()
+    fp.seek(header_offset)
+    fp.write(RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, codebook, DOTS_PER_CHAR, chars_per_row, total, crc))
+    fp.seek(end)
+    return total
+
+def encrypt_raw(source, fp, chars_per_row=CHARS_PER_ROW, stats=None, codebook=None):
+    """
+    Encode text from source (a string, file or iterable of strings) to a raw
+    cell file at fp, streaming like encrypt_stream. Returns the glyph count.
+    """
+    stats = stats or NULL_STATS
+
+    def blocks():
+        for chunk in iter_text(source):
+            with stats.stage("render"):
+                indices, unknown = encode_glyphs(chunk, codebook)
+                cells = glyph_cells(indices, codebook)
+            stats.add("unknown_chars", unknown)
+            if codebook is None:
+                yield cells, normalize_message(chunk)
+            else:
+                yield cells, "".join(codebook.chars[i] for i in indices)
+
+    version = CODEBOOK_VERSION if codebook is None else codebook.version
+    total = write_raw(fp, blocks(), chars_per_row, version)
+    stats.add("chars_encoded", total)
+    return total
+
+class RawCells:
+    """
+    A raw cell file opened for random access: cells is an (n, 9) np.memmap of
+    its palette indices, so decode(start, stop) reads only the pages holding
+    those characters. Use as a context manager to release the mapping.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as fp:
+            header = fp.read(RAW_HEADER.size)
+        if len(header) < RAW_HEADER.size or not header.startswith(RAW_MAGIC):
+            raise ValueError(f"Not a raw cell file: {path}")
+        _, version, codebook, dots, self.chars_per_row, self.chars, self.crc32 = RAW_HEADER.unpack(header)
+        if version != RAW_VERSION:
+            raise ValueError(f"Unsupported raw cell file version: {version}")
+        self.codebook = None if codebook == CODEBOOK_VERSION else load_codebook(codebook)
+        if dots != DOTS_PER_CHAR or self.chars_per_row <= 0:
+            raise ValueError(f"Invalid raw cell file header: {path}")
+        if os.path.getsize(path) < RAW_HEADER.size + self.chars * DOTS_PER_CHAR:
+            raise ValueError(f"Truncated raw cell file: {path}")
+        self.path = path
+        self.cells = np.memmap(path, dtype=np.uint8, mode="r", offset=RAW_HEADER.size,
+                               shape=(self.chars, DOTS_PER_CHAR)) if self.chars else \
+            np.zeros((0, DOTS_PER_CHAR), dtype=np.uint8)
+
+    def __len__(self):
+        return self.chars
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.cells = None
+
+    @property
+    def layout(self):
+        version = CODEBOOK_VERSION if self.codebook is None else self.codebook.version
+        return make_layout(self.chars, self.crc32, self.chars_per_row, codebook=version)
+
+    def decode(self, start=0, stop=None, stats=None):
+        """
+        Decode glyphs [start, stop); the whole file is checked against its
+        checksum. With an extended codebook, escape sequences cut by the range
+        come back as U+FFFD.
+        """
+        stats = stats or NULL_STATS
+        start, stop, _ = slice(start, stop).indices(self.chars)
+        if start >= stop:
+            return ""
+        with stats.stage("load"):
+            cells = np.array(self.cells[start:stop])
+        with stats.stage("match"):
+            text = cells_text(cells, stats, self.codebook)
+        if (start, stop) == (0, self.chars):
+            check_layout(text, self.layout)
+        return unescape_text(text, self.codebook)
+
+    def iter_blocks(self, size):
+        """Yield copies of the cells size characters at a time."""
+        for start in range(0, self.chars, size):
+            yield np.array(self.cells[start:start + size])
+
+def decode_raw(path, start=0, stop=None, stats=None):
+    """Decode characters [start, stop) of the raw cell file at path."""
+    with RawCells(path) as raw:
+        return raw.decode(start, stop, stats)
+
+def png_to_raw(png_path, raw_path, band_rows=16, stats=None):
+    """
+    Convert a dot image (visual or compact) to a raw cell file, streaming it
+    strip by strip where decrypt_image_iter would. The cells are stored as
+    classified, so the raw file decodes exactly like the image; with layout
+    metadata the checksum is verified before raw_path is replaced. Returns
+    the character count.
+    """
+    stats = stats or NULL_STATS
+    layout, cols, blocks = image_cells(png_path, band_rows, stats)
+    version = CODEBOOK_VERSION if layout is None else layout["codebook"]
+
+    def matched():
+        yield from match_cells(blocks, layout, stats)
+        # Trailing spaces the image leaves undrawn are stored as blank cells
+        tail = layout_tail(layout)
+        if tail:
+            yield np.full((len(tail), DOTS_PER_CHAR), EMPTY, dtype=np.uint8), tail
+
+    return _write_replacing(raw_path, lambda fp: write_raw(fp, matched(), cols, version))
+
+def raw_to_png(raw_path, png_path, block=None, band_rows=16, stats=None):
+    """
+    Convert a raw cell file to a dot image: streamed with encrypt_stream, or
+    in the compact format with block pixels per dot. The raw checksum is
+    verified before png_path is replaced. Returns the character count.
+    """
+    stats = stats or NULL_STATS
+    with RawCells(raw_path) as raw:
+        codebook = raw.codebook
+        if block:
+            message = raw.decode(stats=stats)
+            return _write_replacing(png_path, lambda fp: encrypt_compact(
+                message, fp, raw.chars_per_row, block, codebook))
+        text = (chars for _, chars in match_cells(raw.iter_blocks(STREAM_READ_SIZE), raw.layout, stats))
+        if codebook is not None:
+            text = codebook.unescape_stream(text)
+        return _write_replacing(png_path, lambda fp: encrypt_stream(
+            text, fp, None, raw.chars_per_row, band_rows, stats=stats, codebook=codebook))
+
+def _write_replacing(path, write):
+    """Call write(fp) on a temporary file and move it over path only if it succeeds."""
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "wb") as fp:
+            result = write(fp)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return result
+
+# ---- Decode cache ----
+class DecodeCache:
+    """
+    Decoded text keyed by a SHA-256 hash of the RGB pixels plus the layout
+    constants. The memory tier is an LRU bounded by max_bytes of UTF-8 text; with
+    directory set, entries are also written there as one file per key, so
+    processes sharing the directory share results. hits, disk_hits, misses
+    and evictions count lookups.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = {}  # key -> (text, UTF-8 size); insertion order is recency order
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(pixels, metadata=None, geometry=None):
+        """
+        Hex key for an (H, W, 3) uint8 C-contiguous array under the current
+        layout constants, the image's layout metadata and the GridGeometry it
+        is sampled with, if any.
+        """
+        import hashlib
+        layout = (
+            pixels.shape, DOT_SIZE, GRID_WIDTH, GRID_HEIGHT, GRID_SPACING,
+            CHAR_SPACING, ROW_SPACING, BG_COLOR, COLORS, CODEBOOK,
+            sorted(metadata.items()) if metadata else None,
+            None if geometry is None else (
+                geometry.x0, geometry.y0, geometry.pitch_x, geometry.pitch_y,
+                geometry.dot_pitch_x, geometry.dot_pitch_y, geometry.cols, geometry.rows,
+            ),
+        )
+        digest = hashlib.sha256(repr(layout).encode("ascii"))
+        digest.update(pixels.data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached text for key, or None."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+        if self.directory is not None:
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    text = f.read()
+            except OSError:
+                text = None
+            if text is not None:
+                self.disk_hits += 1
+                self._remember(key, text)
+                return text
+        self.misses += 1
+        return None
+
+    def put(self, key, text):
+        self._remember(key, text)
+        if self.directory is not None:
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Drop the memory tier; files in directory are left alone."""
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else None,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def _remember(self, key, text):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (text, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.size -= self.entries.pop(oldest)[1]
+            self.evictions += 1
+
+# ---- Incremental decoding ----
+# Inflater checkpoints kept per path; appends only invalidate the last few
+INCREMENTAL_CHECKPOINTS = 4
+
+class IncrementalDecoder:
+    """
+    Re-decodes images that producers keep appending glyph rows to. For each
+    path it keeps the text and a digest of every glyph row, plus checkpoints
+    of the inflater state at strip boundaries keyed by a hash of the
+    compressed data before them. decode() hashes the new file's compressed
+    data to find the last checkpoint it still matches and inflates only from
+    there; rows after it are hashed and only those whose digest changed are
+    sampled, classified and matched. An append therefore costs time
+    proportional to the new rows (plus hashing the compressed file), not to
+    the whole image. Files whose size and mtime have not changed are not read.
+    """
+
+    def __init__(self):
+        self.entries = {}  # real path -> dict of signature, format, digests, rows, checkpoints, text
+
+    def forget(self, path=None):
+        """Drop the state kept for path, or for every path."""
+        if path is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(os.path.realpath(path), None)
+
+    def decode(self, path, band_rows=16, stats=None):
+        """
+        Decode the image at path and return (text, offset), where text[:offset]
+        is unchanged since the previous decode of path and text[offset:] is
+        new. Images that are not streamed on the default grid (compact, raw,
+        rescaled, interlaced, or using an extended codebook) are decoded in
+        full, and offset is then the length of the prefix shared with the
+        previous text.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No such file: {path}")
+        stats = stats or NULL_STATS
+        key = os.path.realpath(path)
+        info = os.stat(key)
+        signature = (info.st_size, info.st_mtime_ns)
+        entry = self.entries.get(key)
+        if entry is not None and entry["signature"] == signature:
+            return entry["text"], len(entry["text"])
+
+        raw = is_raw_cells(key)
+        chunks = {} if raw else png_text(key)
+        layout = parse_layout(chunks[LAYOUT_TEXT_KEY]) if LAYOUT_TEXT_KEY in chunks else None
+        state = None
+        if not raw and COMPACT_TEXT_KEY not in chunks and layout_codebook(layout) is None and \
+                on_default_grid(layout, *image_dimensions(key)):
+            state = self._decode_rows(key, band_rows, layout, entry, stats)
+        if state is None:
+            text = decrypt_image(key, stats=stats)
+            offset = common_prefix_length(entry["text"], text) if entry is not None else 0
+            self.entries[key] = {"signature": signature, "format": None, "text": text}
+            return text, offset
+
+        cols = state["format"][-1]
+        text = "".join(state["rows"])
+        if layout is not None:
+            text = text[:layout["chars"]]
+            check_layout(text, layout)
+            text += layout_tail(layout)
+        changed = state.pop("changed")
+        offset = len(text) if changed is None else min(len(text), changed * cols)
+        self.entries[key] = dict(state, signature=signature, text=text)
+        return text, offset
+
+    def _decode_rows(self, path, band_rows, layout, entry, stats):
+        """
+        Decode the glyph rows of a streamable PNG, resuming from entry where
+        it still matches. Returns the new state with the first re-decoded
+        glyph row as "changed" (None if every row was reused), or None for
+        PNGs the strip reader cannot handle.
+        """
+        import hashlib
+        grid_w, grid_h = grid_pixel_size()
+        pitch_h = grid_h + ROW_SPACING
+        strip_height = band_rows * pitch_h
+        with open(path, "rb") as fp:
+            fp.read(len(PNG_SIGNATURE))
+            chunks = _png_chunks(fp)
+            tag, ihdr = next(chunks)
+            width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+            if tag != b"IHDR" or depth != 8 or interlace or color_type not in PNG_STRIP_MODES:
+                return None
+            stride = width * PNG_STRIP_MODES[color_type][1] + 1
+            palette, chunks = _read_to_idat(chunks)
+            cols = layout["chars_per_row"] if layout is not None else grid_shape(width, height)[0]
+            form = (width, color_type, palette, strip_height, cols)
+
+            old = entry if entry is not None and entry["format"] == form else None
+            checkpoints = old["checkpoints"] if old is not None else []
+            with stats.stage("hash"):
+                matched, buffered = _match_checkpoint(checkpoints, chunks)
+            if matched is None:
+                reader = _ScanlineReader(_prepend((b"IDAT", buffered), chunks), stride,
+                                         hasher=hashlib.blake2b(digest_size=16))
+                start_y, previous = 0, None
+                checkpoints = []
+            else:
+                reader = _ScanlineReader(_prepend((b"IDAT", buffered), chunks), stride, matched["inflater"].copy(),
+                                         matched["hasher"].copy(), matched["consumed"])
+                start_y, previous = matched["y"], matched["previous"]
+                checkpoints = checkpoints[:checkpoints.index(matched) + 1]
+            resumed = start_y // pitch_h
+            old_digests = old["digests"] if old is not None else []
+            digests = old_digests[:resumed]
+            rows = old["rows"][:resumed] if old is not None else []
+            stats.add("resumed_rows", resumed)
+
+            changed = None
+            for y in range(start_y, height, strip_height):
+                num_pixel_rows = min(strip_height, height - y)
+                with stats.stage("inflate"):
+                    data = reader.read(num_pixel_rows)
+                    if len(data) != num_pixel_rows * stride:
+                        raise ValueError("Truncated PNG image data")
+                    strip, previous = _unfilter_strip(data, previous, width, color_type, palette)
+                if y + strip_height < height:
+                    checkpoints.append({
+                        "y": y + strip_height, "consumed": reader.consumed, "digest": reader.hasher.digest(),
+                        "hasher": reader.hasher.copy(), "inflater": reader.inflater.copy(), "previous": previous,
+                    })
+                    del checkpoints[:-INCREMENTAL_CHECKPOINTS]
+                num_rows = grid_shape(width, num_pixel_rows)[1]
+                if num_rows <= 0 or cols <= 0:
+                    continue
+                start = len(digests)
+                with stats.stage("hash"):
+                    for row in range(num_rows):
+                        pixels = np.ascontiguousarray(strip[row * pitch_h:row * pitch_h + grid_h])
+                        digests.append(hashlib.blake2b(pixels.data, digest_size=16).digest())
+                first = 0
+                if changed is None:
+                    while first < num_rows and start + first < len(old_digests) and \
+                            digests[start + first] == old_digests[start + first]:
+                        rows.append(old["rows"][start + first])
+                        first += 1
+                    stats.add("reused_rows", first)
+                    if first == num_rows:
+                        continue
+                    changed = start + first
+                chars = _decode_cells(strip[first * pitch_h:], num_rows - first, cols, stats)
+                rows.extend(chars[i:i + cols] for i in range(0, len(chars), cols))
+        return {"format": form, "digests": digests, "rows": rows, "checkpoints": checkpoints, "changed": changed}
+
+def _match_checkpoint(checkpoints, chunks):
+    """
+    Hash the IDAT payload read from chunks against each checkpoint's digest
+    in turn. Returns (last matching checkpoint or None, the payload bytes
+    read past it, to be inflated next).
+    """
+    import hashlib
+    hasher = hashlib.blake2b(digest_size=16)
+    buffered = bytearray()  # payload from offset base on
+    base = 0
+    matched = None
+    for checkpoint in checkpoints:
+        end = checkpoint["consumed"]
+        while base + len(buffered) < end:
+            tag, data = next(chunks, (b"IEND", b""))
+            if tag == b"IEND":
+                break
+            if tag == b"IDAT":
+                buffered += data
+        if base + len(buffered) < end:
+            break
+        hasher.update(buffered[:end - base])
+        if hasher.digest() != checkpoint["digest"]:
+            break
+        matched = checkpoint
+        del buffered[:end - base]
+        base = end
+    return matched, bytes(buffered)
+
+# ---- Parallel decoding ----
+# Below this many cells, starting a process pool costs more than it saves
+PARALLEL_MIN_CELLS = 20000
+
+def _decode_band(shm_name, shape, row_start, row_stop, collect_stats=False, cols=None, limit=None):
+    """
+    Worker: decode glyph rows [row_start, row_stop) of the image held in shared
+    memory, cols glyphs wide (inferred by default) and at most limit glyphs.
+    Returns (text, stats dict or None).
+    """
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        arr = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        grid_w, grid_h = grid_pixel_size()
+        cols = cols or grid_shape(shape[1], shape[0])[0]
+        band = arr[row_start * (grid_h + ROW_SPACING):]
+        stats = CodecStats() if collect_stats else NULL_STATS
+        text = _decode_cells(band, row_stop - row_start, cols, stats, limit)
+        del arr, band  # release the views before closing the mapping
+        return text, stats.as_dict() if collect_stats else None
+    finally:
+        shm.close()
+
+def decrypt_image_parallel(path="encrypted_message.png", workers=None, min_cells=PARALLEL_MIN_CELLS,
+                           stats=None):
+    """
+    Decode the image at path with its glyph rows split into bands across a
+    process pool. Pixels are streamed into shared memory once and workers map
+    it instead of receiving pickled copies. Small images are decoded serially.
+    Worker stats are merged into stats, so stage times sum CPU across workers.
+    Raw cell files need no pixel work and are decoded through their memory map.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such file: {path}")
+    if is_raw_cells(path):
+        with RawCells(path) as raw:
+            return raw.decode(stats=stats)
+
+    workers = workers or os.cpu_count() or 1
+    width, height = image_dimensions(path)
+    cols, rows = grid_shape(width, height)
+    info = png_text(path)
+    layout = parse_layout(info[LAYOUT_TEXT_KEY]) if LAYOUT_TEXT_KEY in info else None
+    if workers <= 1 or rows * cols < min_cells or COMPACT_TEXT_KEY in info or \
+            layout_codebook(layout) is not None or not on_default_grid(layout, width, height):
+        return "".join(decrypt_image_iter(path, stats=stats))
+    chars = None
+    if layout is not None:
+        cols, chars = layout["chars_per_row"], layout["chars"]
+        rows = (chars + cols - 1) // cols
+
+    shape = (height, width, 3)
+    shm = shared_memory.SharedMemory(create=True, size=height * width * 3)
+    try:
+        arr = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        y = 0
+        with (stats or NULL_STATS).stage("inflate"):
+            for strip in iter_image_strips(path, 1024):
+                arr[y:y + len(strip)] = strip
+                y += len(strip)
+        del arr
+
+        bounds = [rows * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_decode_band, shm.name, shape, start, stop, stats is not None, cols,
+                            None if chars is None else chars - start * cols)
+                for start, stop in zip(bounds, bounds[1:]) if stop > start
+            ]
+            parts = []
+            for future in futures:
+                text, band_stats = future.result()
+                parts.append(text)
+                if stats is not None:
+                    stats.merge(band_stats)
+        text = "".join(parts)
+        if layout is not None:
+            check_layout(text, layout)
+        return text + layout_tail(layout)
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,269 @@
+# preview.py - scrollable, zoomable preview that only renders the visible tiles
+import tkinter as tk
+
+import customtkinter as ctk
+import numpy as np
+from PIL import Image, ImageTk
+
+TILE_SIZE = 256
+# Rendered tiles kept across scrolling and zooming; about 64 MB of RGB at 256 px
+MAX_CACHED_TILES = 256
+# Zoom is BASE * 2 ** (level / ZOOM_STEPS), so each level is a cache key
+ZOOM_STEPS = 4
+MIN_ZOOM_LEVEL = -6 * ZOOM_STEPS
+MAX_ZOOM_LEVEL = 3 * ZOOM_STEPS
+
+def image_size(image):
+    """(width, height) of a PIL image or an (H, W, 3) array."""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
+
+def tile_image(image, zoom, tx, ty, tile_size=TILE_SIZE):
+    """
+    Render tile (tx, ty) of image (PIL or an (H, W, 3) array) scaled by zoom,
+    with nearest-neighbour sampling straight from the source box it covers,
+    so the cost depends on the tile size only. Returns None for tiles outside
+    the scaled image.
+    """
+    image_w, image_h = image_size(image)
+    scaled_w = max(1, round(image_w * zoom))
+    scaled_h = max(1, round(image_h * zoom))
+    x0, y0 = tx * tile_size, ty * tile_size
+    if x0 >= scaled_w or y0 >= scaled_h:
+        return None
+    width = min(tile_size, scaled_w - x0)
+    height = min(tile_size, scaled_h - y0)
+    if isinstance(image, np.ndarray):
+        ys = np.minimum(((y0 + np.arange(height) + 0.5) / zoom).astype(np.intp), image_h - 1)
+        xs = np.minimum(((x0 + np.arange(width) + 0.5) / zoom).astype(np.intp), image_w - 1)
+        return Image.fromarray(image[ys[:, None], xs])
+    box = (
+        x0 / zoom, y0 / zoom,
+        min(image_w, (x0 + width) / zoom), min(image_h, (y0 + height) / zoom),
+    )
+    return image.resize((width, height), Image.Resampling.NEAREST, box=box)
+
+class TiledPreview(ctk.CTkFrame):
+    """
+    Canvas preview for arbitrarily tall images. Only tiles intersecting the
+    viewport are rendered; each zoom level keeps its own tiles in a shared
+    LRU, so scrolling back or returning to a zoom level reuses them. Mouse
+    wheel scrolls, Shift+wheel scrolls sideways and Ctrl+wheel zooms.
+    """
+
+    def __init__(self, master, empty_text="No image", **kwargs):
+        super().__init__(master, **kwargs)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        self.canvas = tk.Canvas(
+            self, highlightthickness=0, background="gray17", xscrollincrement=20, yscrollincrement=20
+        )
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.y_scrollbar = ctk.CTkScrollbar(self, orientation="vertical", command=self.scroll_y)
+        self.y_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.x_scrollbar = ctk.CTkScrollbar(self, orientation="horizontal", command=self.scroll_x)
+        self.x_scrollbar.grid(row=1, column=0, sticky="ew")
+        self.canvas.configure(xscrollcommand=self.x_scrollbar.set, yscrollcommand=self.y_scrollbar.set)
+
+        self.empty_text = empty_text
+        self.image = None
+        self.image_size = (0, 0)
+        self.base_zoom = 1.0
+        self.level = 0
+        self.tiles = {}  # (level, tx, ty) -> PhotoImage, in recency order
+        self.items = {}  # (level, tx, ty) -> canvas item currently placed
+        self.redraw_pending = False
+
+        canvas = self.canvas
+        canvas.bind("<Configure>", lambda event: self.schedule_redraw())
+        canvas.bind("<MouseWheel>", self.on_wheel)
+        canvas.bind("<Shift-MouseWheel>", lambda event: self.on_wheel(event, horizontal=True))
+        canvas.bind("<Control-MouseWheel>", lambda event: self.on_wheel(event, zoom=True))
+        # X11 reports the wheel as buttons 4 and 5
+        for button, direction in ((4, -1), (5, 1)):
+            canvas.bind(f"<Button-{button}>", lambda event, d=direction: self.on_wheel(event, steps=d))
+            canvas.bind(f"<Shift-Button-{button}>",
+                        lambda event, d=direction: self.on_wheel(event, steps=d, horizontal=True))
+            canvas.bind(f"<Control-Button-{button}>",
+                        lambda event, d=direction: self.on_wheel(event, steps=d, zoom=True))
+        self.show_empty()
+
+    @property
+    def zoom(self):
+        return self.base_zoom * 2 ** (self.level / ZOOM_STEPS)
+
+    def set_image(self, image):
+        """
+        Show image (a PIL image or (H, W, 3) array, kept by reference) fitted
+        to the viewport width and scrolled to the top.
+        """
+        self.image = image
+        self.image_size = image_size(image)
+        self.clear_tiles()
+        self.level = 0
+        view_width = self.canvas.winfo_width()
+        # Fit the width so dots stay legible however tall the image is
+        self.base_zoom = min(1.0, view_width / self.image_size[0]) if view_width > 1 else 1.0
+        self.update_scrollregion()
+        self.canvas.xview_moveto(0)
+        self.canvas.yview_moveto(0)
+        self.schedule_redraw()
+
+    def update_image(self, image, box=None):
+        """
+        Swap in an edited version of the image keeping zoom and scroll; only
+        tiles overlapping box (source pixels) are re-rendered, all if None.
+        """
+        if self.image is None:
+            self.set_image(image)
+            return
+        old_w, old_h = self.image_size
+        self.image = image
+        self.image_size = image_size(image)
+        if box is not None and self.image_size != (old_w, old_h):
+            # Edge tiles were clipped to the old size
+            self.invalidate((0, min(old_h, self.image_size[1]), max(old_w, self.image_size[0]),
+                             max(old_h, self.image_size[1])))
+        self.update_scrollregion()
+        self.invalidate(box)
+
+    def invalidate(self, box=None):
+        """Drop cached tiles overlapping box (source pixels), or all of them, after the image changed."""
+        if box is None or self.image is None:
+            self.clear_tiles()
+        else:
+            for key in list(self.tiles):
+                if boxes_overlap(self.tile_box(*key), box):
+                    del self.tiles[key]
+                    item = self.items.pop(key, None)
+                    if item is not None:
+                        self.canvas.delete(item)
+        self.schedule_redraw()
+
+    def clear(self):
+        self.image = None
+        self.image_size = (0, 0)
+        self.clear_tiles()
+        self.show_empty()
+
+    def clear_tiles(self):
+        self.canvas.delete("all")
+        self.tiles.clear()
+        self.items.clear()
+
+    def show_empty(self):
+        self.canvas.delete("all")
+        self.canvas.configure(scrollregion=(0, 0, 0, 0))
+        self.canvas.create_text(
+            self.canvas.winfo_width() // 2 or 200, self.canvas.winfo_height() // 2 or 100,
+            text=self.empty_text, fill="gray70", tags="empty",
+        )
+
+    def tile_box(self, level, tx, ty):
+        """Source-pixel box covered by a tile."""
+        zoom = self.base_zoom * 2 ** (level / ZOOM_STEPS)
+        return (tx * TILE_SIZE / zoom, ty * TILE_SIZE / zoom,
+                (tx + 1) * TILE_SIZE / zoom, (ty + 1) * TILE_SIZE / zoom)
+
+    def update_scrollregion(self):
+        zoom = self.zoom
+        width, height = self.image_size
+        self.canvas.configure(scrollregion=(0, 0, max(1, round(width * zoom)), max(1, round(height * zoom))))
+
+    # ---- Scrolling and zooming ----
+    def scroll_y(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_redraw()
+
+    def scroll_x(self, *args):
+        self.canvas.xview(*args)
+        self.schedule_redraw()
+
+    def on_wheel(self, event, steps=None, horizontal=False, zoom=False):
+        if self.image is None:
+            return
+        if steps is None:
+            # Windows reports multiples of 120, macOS small deltas
+            steps = -1 if event.delta > 0 else 1
+        if zoom:
+            self.zoom_by(-steps, event.x, event.y)
+        elif horizontal:
+            self.scroll_x("scroll", steps * 3, "units")
+        else:
+            self.scroll_y("scroll", steps * 3, "units")
+
+    def zoom_by(self, levels, x=None, y=None):
+        """Change the zoom level, keeping the source point under canvas position (x, y) in place."""
+        level = max(MIN_ZOOM_LEVEL, min(MAX_ZOOM_LEVEL, self.level + levels))
+        if self.image is None or level == self.level:
+            return
+        if x is None:
+            x, y = self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2
+        old_zoom = self.zoom
+        source_x = self.canvas.canvasx(x) / old_zoom
+        source_y = self.canvas.canvasy(y) / old_zoom
+
+        self.level = level
+        for item in self.items.values():
+            self.canvas.delete(item)
+        self.items.clear()
+        self.update_scrollregion()
+
+        zoom = self.zoom
+        scaled_w = max(1, round(self.image_size[0] * zoom))
+        scaled_h = max(1, round(self.image_size[1] * zoom))
+        self.canvas.xview_moveto(max(0.0, source_x * zoom - x) / scaled_w)
+        self.canvas.yview_moveto(max(0.0, source_y * zoom - y) / scaled_h)
+        self.schedule_redraw()
+
+    # ---- Rendering ----
+    def schedule_redraw(self):
+        # Coalesce bursts of scroll and resize events into one redraw
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        if self.image is None:
+            self.show_empty()
+            return
+
+        left = int(self.canvas.canvasx(0)) // TILE_SIZE
+        top = int(self.canvas.canvasy(0)) // TILE_SIZE
+        right = int(self.canvas.canvasx(self.canvas.winfo_width())) // TILE_SIZE
+        bottom = int(self.canvas.canvasy(self.canvas.winfo_height())) // TILE_SIZE
+        visible = {
+            (self.level, tx, ty)
+            for ty in range(max(0, top), bottom + 1)
+            for tx in range(max(0, left), right + 1)
+        }
+
+        for key in list(self.items):
+            if key not in visible:
+                self.canvas.delete(self.items.pop(key))
+        for key in sorted(visible):
+            if key in self.items:
+                continue
+            photo = self.tiles.pop(key, None)
+            if photo is None:
+                tile = tile_image(self.image, self.zoom, key[1], key[2])
+                if tile is None:
+                    continue
+                photo = ImageTk.PhotoImage(tile)
+            self.tiles[key] = photo  # most recently used goes last
+            self.items[key] = self.canvas.create_image(
+                key[1] * TILE_SIZE, key[2] * TILE_SIZE, image=photo, anchor="nw"
+            )
+
+        # Evict the least recently used tiles that are not on screen
+        for key in list(self.tiles):
+            if len(self.tiles) <= MAX_CACHED_TILES:
+                break
+            if key not in self.items:
+                del self.tiles[key]
+
+def boxes_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
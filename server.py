@@ -0,0 +1,271 @@
+# server.py - localhost HTTP encode/decode service backed by a process pool
+import argparse
+import asyncio
+import io
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from dot_codec import CodecStats, decode_image, encrypt_stream
+
+# The service never listens beyond the loopback interface
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+REQUEST_TIMEOUT = 30.0  # seconds a job may run or wait before the client gets 504
+IDLE_TIMEOUT = 15.0  # seconds a keep-alive connection may sit between requests
+MAX_BODY_BYTES = 64 * 1024 * 1024
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+
+# ---- Worker jobs (run in the process pool) ----
+def encode_job(text):
+    """Encode text to PNG bytes; returns (png, stats dict)."""
+    stats = CodecStats()
+    out = io.BytesIO()
+    encrypt_stream(text, out, stats=stats)
+    return out.getvalue(), stats.as_dict()
+
+def decode_job(data):
+    """Decode PNG bytes to UTF-8 text; returns (text bytes, stats dict)."""
+    stats = CodecStats()
+    text = decode_image(data, stats=stats)
+    return text.encode("utf-8"), stats.as_dict()
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+
+class CodecServer:
+    """
+    Serves POST /encode (text -> image/png), POST /decode (PNG -> text/plain),
+    GET /health and GET /metrics. At most max_pending jobs are admitted, queued
+    or running; beyond that requests get 503 straight away instead of piling up
+    in the pool. Request bodies not received within timeout get 408 and jobs
+    slower than timeout get 504. Responses are sent chunked.
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=REQUEST_TIMEOUT, max_body=MAX_BODY_BYTES):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self.timeout = timeout
+        self.max_body = max_body
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.pending = 0
+        self.stats = CodecStats()
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request_head(reader), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, ConnectionError):
+                    return
+                except (ValueError, asyncio.LimitOverrunError):
+                    await send_response(writer, 400, b"Malformed request\n", keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, target, version, headers = request
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    status, content_type, body = await self.dispatch(method, target, headers, reader)
+                except HTTPError as e:
+                    # The body may be unread, so the connection cannot be reused
+                    keep_alive = False
+                    status, content_type, body = e.status, "text/plain; charset=utf-8", f"{e}\n".encode("utf-8")
+                extra = ("Retry-After: 1",) if status == 503 else ()
+                await send_response(writer, status, body, content_type, keep_alive, extra)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers, reader):
+        path = urlsplit(target).path
+        self.stats.add("http_requests")
+        if path == "/health" and method == "GET":
+            return 200, "text/plain; charset=utf-8", b"ok\n"
+        if path == "/metrics" and method == "GET":
+            return 200, "text/plain; version=0.0.4", self.stats.to_prometheus().encode("utf-8")
+        if path not in ("/encode", "/decode"):
+            raise HTTPError(404)
+        if method != "POST":
+            raise HTTPError(405)
+
+        # Admission control happens before the body is read, so a flood of
+        # large uploads is turned away without buffering them. The slot is
+        # reserved now, while the body arrives (within timeout), and handed
+        # over to the job.
+        if self.pending >= self.max_pending:
+            self.stats.add("http_rejected")
+            raise HTTPError(503, "Server busy, retry later")
+        self.pending += 1
+        try:
+            try:
+                body = await asyncio.wait_for(read_body(reader, headers, self.max_body), self.timeout)
+            except asyncio.TimeoutError:
+                self.stats.add("http_body_timeouts")
+                raise HTTPError(408, f"Request body not received within {self.timeout:g}s")
+            if path == "/encode":
+                try:
+                    job = encode_job, body.decode("utf-8")
+                except UnicodeDecodeError:
+                    raise HTTPError(400, "Request body must be UTF-8 text")
+            else:
+                job = decode_job, body
+        except BaseException:
+            self._job_finished()
+            raise
+
+        result = await self.run_job(*job)
+        if path == "/encode":
+            return 200, "image/png", result
+        return 200, "text/plain; charset=utf-8", result
+
+    async def run_job(self, fn, *args):
+        """
+        Run fn in the pool under the timeout, merging its stats. The caller has
+        reserved an admission slot; it is freed when the job ends.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self._job_finished()
+            raise
+        # A timed-out job keeps its worker busy, so the slot is only freed when it really ends
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._job_finished))
+        try:
+            result, stats = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self.stats.add("http_timeouts")
+            raise HTTPError(504, f"Job did not finish within {self.timeout:g}s")
+        except (ValueError, OSError) as e:
+            raise HTTPError(400, str(e))
+        except Exception as e:
+            raise HTTPError(500, f"{type(e).__name__}: {e}")
+        self.stats.merge(stats)
+        return result
+
+    def _job_finished(self):
+        self.pending -= 1
+
+
+# ---- HTTP/1.1 framing ----
+async def read_request_head(reader):
+    """Return (method, target, version, headers) or None at end of stream."""
+    line = await reader.readline()
+    if not line:
+        return None
+    method, target, version = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return method, target, version, headers
+        name, sep, value = line.decode("latin-1").partition(":")
+        if not sep:
+            raise ValueError(f"Malformed header line: {line!r}")
+        headers[name.strip().lower()] = value.strip()
+
+async def read_body(reader, headers, max_body):
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(411, "Send the body with a Content-Length")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(400, "Bad Content-Length")
+    if length > max_body:
+        raise HTTPError(413, f"Body larger than {max_body} bytes")
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise HTTPError(400, "Truncated request body")
+
+async def send_response(writer, status, body, content_type="text/plain; charset=utf-8",
+                        keep_alive=True, extra_headers=()):
+    """Write a chunked response, draining after each chunk so slow readers apply back-pressure."""
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        "Transfer-Encoding: chunked",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        *extra_headers,
+    ]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+    view = memoryview(body)
+    for start in range(0, len(view), RESPONSE_CHUNK_SIZE):
+        chunk = view[start:start + RESPONSE_CHUNK_SIZE]
+        writer.write(b"%x\r\n" % len(chunk))
+        writer.write(chunk)
+        writer.write(b"\r\n")
+        await writer.drain()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def serve(port=DEFAULT_PORT, ready=None, **options):
+    """Serve until cancelled or sent SIGTERM, then shut the worker pool down."""
+    server = CodecServer(**options)
+    listener = await asyncio.start_server(server.handle_connection, HOST, port)
+    loop = asyncio.get_running_loop()
+    serving = asyncio.current_task()
+    terminated = []
+
+    def terminate():
+        terminated.append(True)
+        serving.cancel()
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, terminate)
+    except (NotImplementedError, RuntimeError):
+        pass  # no signal handlers on Windows or outside the main thread
+    if ready is not None:
+        ready(listener.sockets[0].getsockname()[1])
+    try:
+        async with listener:
+            await listener.serve_forever()
+    except asyncio.CancelledError:
+        if not terminated:
+            raise
+    finally:
+        server.close()
+        try:
+            loop.remove_signal_handler(signal.SIGTERM)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve dot codec encode/decode over HTTP on localhost.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="jobs admitted at once, queued or running (default: 4 per worker)")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="per-request job timeout in seconds")
+    args = parser.parse_args(argv)
+
+    def ready(port):
+        print(f"Serving on http://{HOST}:{port}", flush=True)
+
+    try:
+        asyncio.run(serve(args.port, ready, workers=args.workers, max_pending=args.max_pending,
+                          timeout=args.timeout))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# shards.py - split long messages across fixed-size images described by a manifest
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from dot_codec import CHARS_PER_ROW, decrypt_image_iter, encrypt_stream, iter_text, normalize_message
+
+MANIFEST_VERSION = 1
+# Glyph rows per shard; with 8 characters per row a full shard is 460 x 51190 px
+DEFAULT_SHARD_ROWS = 1024
+
+
+def text_checksum(text):
+    """SHA-256 of the text a clean decode yields, so checksums compare against decoder output."""
+    return hashlib.sha256(normalize_message(text).encode("utf-8")).hexdigest()
+
+
+def iter_chunks(source, size):
+    """
+    Yield consecutive size-glyph pieces of the text from a string, file or
+    iterable of strings, normalized first so that one character is one glyph
+    (upper-casing can lengthen text: "ß" becomes "SS").
+    """
+    buffered = ""
+    for chunk in iter_text(source):
+        buffered += normalize_message(chunk)
+        while len(buffered) >= size:
+            yield buffered[:size]
+            buffered = buffered[size:]
+    if buffered:
+        yield buffered
+
+
+def encode_shard(text, path, chars_per_row):
+    """Worker: encode one shard and return (glyph count, checksum)."""
+    return encrypt_stream(text, path, chars_per_row=chars_per_row), text_checksum(text)
+
+
+def decode_shard_file(path, checksum):
+    """Worker: decode one shard image, bounded by its layout metadata, and check it against its checksum."""
+    text = "".join(decrypt_image_iter(path))
+    if checksum is not None and hashlib.sha256(text.encode("utf-8")).hexdigest() != checksum:
+        raise ValueError(f"Checksum mismatch in shard {path}")
+    return text
+
+
+def encode_sharded(source, output_dir, name="message", chars_per_row=CHARS_PER_ROW,
+                   shard_rows=DEFAULT_SHARD_ROWS, workers=None):
+    """
+    Encode text from source (a string, file or iterable of strings) into
+    output_dir/<name>-00000.png, ... and write output_dir/<name>.json last,
+    so a manifest only exists for a complete set. Shards are encoded in a
+    process pool with a bounded number in flight, so the whole message is
+    never held in memory. Returns the manifest path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shard_chars = chars_per_row * shard_rows
+    workers = workers or os.cpu_count() or 1
+    shards = []
+    digest = hashlib.sha256()
+    offset = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        futures = []
+        for index, text in enumerate(iter_chunks(source, shard_chars)):
+            if len(in_flight) >= 2 * workers:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            file_name = f"{name}-{index:05d}.png"
+            future = pool.submit(encode_shard, text, os.path.join(output_dir, file_name), chars_per_row)
+            in_flight.add(future)
+            futures.append(future)
+            shards.append({"file": file_name, "offset": offset, "chars": len(text)})
+            digest.update(text.encode("utf-8"))
+            offset += len(text)
+        for shard, future in zip(shards, futures):
+            chars, shard["sha256"] = future.result()
+            if chars != shard["chars"]:
+                raise ValueError(f"Shard {shard['file']} holds {chars} glyphs, expected {shard['chars']}")
+
+    if not shards:
+        raise ValueError("Cannot encode an empty message")
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "chars_per_row": chars_per_row,
+        "shard_chars": shard_chars,
+        "total_chars": offset,
+        "sha256": digest.hexdigest(),
+        "shards": shards,
+    }
+    manifest_path = os.path.join(output_dir, f"{name}.json")
+    tmp = f"{manifest_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+    return manifest_path
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported shard manifest version: {manifest.get('version')}")
+    return manifest
+
+
+def shard_for_offset(manifest, offset):
+    """Return the index of the shard holding character offset."""
+    if not 0 <= offset < manifest["total_chars"]:
+        raise IndexError(f"Offset {offset} outside message of {manifest['total_chars']} characters")
+    starts = [shard["offset"] for shard in manifest["shards"]]
+    return bisect.bisect_right(starts, offset) - 1
+
+
+def decode_shard(manifest_path, index, manifest=None):
+    """Decode only shard index, verified against its checksum."""
+    manifest = manifest or load_manifest(manifest_path)
+    shard = manifest["shards"][index]
+    path = os.path.join(os.path.dirname(manifest_path), shard["file"])
+    return decode_shard_file(path, shard["sha256"])
+
+
+def read_range(manifest_path, start, stop):
+    """Decode characters [start, stop), touching only the shards that hold them."""
+    manifest = load_manifest(manifest_path)
+    stop = min(stop, manifest["total_chars"])
+    if start >= stop:
+        return ""
+    parts = []
+    for index in range(shard_for_offset(manifest, start), shard_for_offset(manifest, stop - 1) + 1):
+        offset = manifest["shards"][index]["offset"]
+        text = decode_shard(manifest_path, index, manifest)
+        parts.append(text[max(0, start - offset):stop - offset])
+    return "".join(parts)
+
+
+def decode_sharded(manifest_path, workers=None):
+    """Decode every shard in parallel and return the whole message, checked against the manifest checksum."""
+    manifest = load_manifest(manifest_path)
+    base_dir = os.path.dirname(manifest_path)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = [
+            pool.submit(decode_shard_file, os.path.join(base_dir, shard["file"]), shard["sha256"])
+            for shard in manifest["shards"]
+        ]
+        text = "".join(future.result() for future in futures)
+    if hashlib.sha256(text.encode("utf-8")).hexdigest() != manifest["sha256"]:
+        raise ValueError(f"Checksum mismatch for {manifest_path}")
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encode a long message into sharded images, or decode them.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    commands = parser.add_subparsers(dest="op", required=True)
+
+    encode = commands.add_parser("encode", help="encode a text file into shards plus a JSON manifest")
+    encode.add_argument("source", help="text file, or - for stdin")
+    encode.add_argument("output_dir")
+    encode.add_argument("--name", default="message", help="file name prefix for the shards and manifest")
+    encode.add_argument("--shard-rows", type=int, default=DEFAULT_SHARD_ROWS, help="glyph rows per shard")
+    encode.add_argument("--chars-per-row", type=int, default=CHARS_PER_ROW)
+
+    decode = commands.add_parser("decode", help="decode a manifest, or part of it, to stdout")
+    decode.add_argument("manifest")
+    decode.add_argument("--offset", type=int, default=None, help="first character to decode")
+    decode.add_argument("--length", type=int, default=None, help="number of characters to decode")
+
+    args = parser.parse_args(argv)
+    if args.op == "encode":
+        if args.source == "-":
+            path = encode_sharded(sys.stdin, args.output_dir, args.name, args.chars_per_row,
+                                  args.shard_rows, args.workers)
+        else:
+            with open(args.source, encoding="utf-8") as f:
+                path = encode_sharded(f, args.output_dir, args.name, args.chars_per_row,
+                                      args.shard_rows, args.workers)
+        manifest = load_manifest(path)
+        print(f"{manifest['total_chars']} characters in {len(manifest['shards'])} shards, manifest {path}")
+    elif args.offset is None and args.length is None:
+        sys.stdout.write(decode_sharded(args.manifest, args.workers))
+    else:
+        start = args.offset or 0
+        stop = start + args.length if args.length is not None else load_manifest(args.manifest)["total_chars"]
+        sys.stdout.write(read_range(args.manifest, start, stop))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())